@@ -0,0 +1,229 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from main import DEFAULT_SAMPLE_RATE, load_constructor, supported_operations
+
+# Powers of four, from 64 to 1M samples
+DEFAULT_BLOCK_SIZES = [4 ** i for i in range(3, 11)]
+DEFAULT_BATCH_SIZES = [1, 16, 256]
+
+# Samples processed by every measurement
+DEFAULT_SAMPLES = 1024 * 1024
+
+DEFAULT_REPEAT = 3
+
+# Relative slowdown reported by the comparison
+DEFAULT_THRESHOLD = 0.1
+
+
+def synthetic_data(nr_samples, seed=0):
+    # Noise that fills most of the 16-bit range, like a real capture
+    rng = np.random.default_rng(seed)
+    return np.clip(rng.normal(0, 8000, nr_samples), -32768, 32767).astype(np.int16)
+
+
+def make_blocks(data, block_size, batch_size):
+    # Whole blocks only, stacked in batches when asked to
+    nr_blocks = len(data) // block_size
+    blocks = data[:nr_blocks * block_size].reshape(nr_blocks, block_size)
+
+    if batch_size == 1:
+        return list(blocks)
+
+    return [blocks[i:i + batch_size] for i in range(0, nr_blocks, batch_size)]
+
+
+def run(op, blocks):
+    # Everything an operation does with a block, in the workers and in the main process
+    for _ in op.join_blocks(map(op.blocks_func, blocks)):
+        pass
+
+
+def measure_time(op, blocks, repeat):
+    times = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(op, blocks)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def measure_memory(op, blocks):
+    """
+    Returns the bytes allocated while processing the blocks and the highest
+    memory peak of a block. Allocations are followed line by line: every
+    line adds the growth of the traced memory up to its peak, so the
+    temporaries freed within a single line only count through their peak.
+    """
+    allocated = 0
+    peak = 0
+
+    tracemalloc.start()
+
+    try:
+        for block in blocks:
+            baseline, _ = tracemalloc.get_traced_memory()
+            previous = baseline
+            block_peak = baseline
+
+            def trace(frame, event, arg):
+                nonlocal allocated, previous, block_peak
+
+                current, line_peak = tracemalloc.get_traced_memory()
+                allocated += line_peak - previous
+                block_peak = max(block_peak, line_peak)
+
+                previous = current
+                tracemalloc.reset_peak()
+
+                return trace
+
+            tracemalloc.reset_peak()
+            sys.settrace(trace)
+
+            try:
+                run(op, [block])
+            finally:
+                sys.settrace(None)
+
+            trace(None, "return", None)
+            peak = max(peak, block_peak - baseline)
+    finally:
+        tracemalloc.stop()
+
+    return allocated, peak
+
+
+def bench(names, block_sizes, batch_sizes, nr_samples, sample_rate, repeat):
+    data = synthetic_data(nr_samples)
+    results = []
+
+    for name in names:
+        constructor = load_constructor(supported_operations[name])
+
+        for block_size in block_sizes:
+            if block_size > nr_samples:
+                continue
+
+            # Some parameters only make sense at some sample rates
+            try:
+                op = constructor(block_size=block_size, sample_rate=sample_rate)
+            except ValueError as e:
+                print(f"{name:<28}skipped: {e}")
+                break
+
+            # Batches only make sense for the operations that accept them
+            for batch_size in batch_sizes if op.batchable else [1]:
+                if batch_size * block_size > nr_samples:
+                    continue
+
+                blocks = make_blocks(data, block_size, batch_size)
+                nr_processed = len(data) // block_size * block_size
+
+                elapsed = measure_time(op, blocks, repeat)
+                allocated, peak = measure_memory(op, blocks)
+
+                result = {
+                    "operation": name,
+                    "block_size": block_size,
+                    "batch_size": batch_size,
+                    "samples_per_second": nr_processed / elapsed,
+                    "allocated_bytes": allocated,
+                    "peak_bytes": peak,
+                }
+                results.append(result)
+
+                print(f"{name:<28}{block_size:>9}{batch_size:>6}"
+                      + f"{result['samples_per_second'] / 1e6:10.2f} MS/s"
+                      + f"{allocated / 1e6:12.1f} MB{peak / 1e6:10.2f} MB")
+
+    return results
+
+
+def result_key(result):
+    return result["operation"], result["block_size"], result["batch_size"]
+
+
+def compare(baseline, results, threshold):
+    """
+    Prints the speed of every measurement relative to the baseline, and
+    returns the number of measurements slower by more than threshold.
+    """
+    previous = {result_key(r): r for r in baseline["results"]}
+    nr_slower = 0
+
+    for result in results:
+        key = result_key(result)
+        if key not in previous:
+            continue
+
+        ratio = result["samples_per_second"] / previous[key]["samples_per_second"]
+        slower = ratio < 1 - threshold
+        nr_slower += slower
+
+        print(f"{key[0]:<28}{key[1]:>9}{key[2]:>6}{ratio:10.2f}x"
+              + ("   SLOWER" if slower else ""))
+
+    return nr_slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cost of the operations.")
+    parser.add_argument("--operations", nargs="+", default=list(supported_operations),
+                        choices=list(supported_operations), metavar="OPERATION",
+                        help="operations to measure, default: all of them")
+    parser.add_argument("--block_sizes", nargs="+", type=int, default=DEFAULT_BLOCK_SIZES,
+                        help=f"default: {DEFAULT_BLOCK_SIZES}")
+    parser.add_argument("--batch_sizes", nargs="+", type=int, default=DEFAULT_BATCH_SIZES,
+                        help=f"blocks stacked at once by batchable operations, default: {DEFAULT_BATCH_SIZES}")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES,
+                        help=f"samples processed by every measurement, default: {DEFAULT_SAMPLES}")
+    parser.add_argument("--sample_rate", type=int, default=DEFAULT_SAMPLE_RATE,
+                        help=f"default: {DEFAULT_SAMPLE_RATE}")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help=f"runs per measurement, the fastest is kept, default: {DEFAULT_REPEAT}")
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"relative slowdown that fails the comparison, default: {DEFAULT_THRESHOLD}")
+    args = parser.parse_args()
+
+    print(f"{'operation':<28}{'block':>9}{'batch':>6}{'speed':>15}{'allocated':>15}{'peak':>13}")
+
+    results = bench(args.operations, args.block_sizes, args.batch_sizes,
+                    args.samples, args.sample_rate, args.repeat)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "machine": platform.machine(),
+                "samples": args.samples,
+                "sample_rate": args.sample_rate,
+                "results": results,
+            }, f, indent=4)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+        print()
+        nr_slower = compare(baseline, results, args.threshold)
+
+        # Let scripts catch the slowdowns
+        if nr_slower > 0:
+            print(f"{nr_slower} measurements are slower than the baseline.")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
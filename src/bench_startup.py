@@ -0,0 +1,68 @@
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from os.path import abspath, dirname, join
+
+MAIN = join(dirname(abspath(__file__)), "main.py")
+
+DEFAULT_RUNS = 10
+
+# Short runs, like the ones started by cron jobs
+SCENARIOS = {
+    "help": ["--help"],
+    "osrandom": ["--source", "osrandom", "--acquire", "--duration", "1"],
+}
+
+
+def time_run(args, cwd):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, MAIN, *args], cwd=cwd, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def import_times(args, cwd, top):
+    # Let the interpreter report the cost of every import
+    result = subprocess.run([sys.executable, "-X", "importtime", MAIN, *args], cwd=cwd,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+
+        _, cumulative, module = line.split("|")
+        if cumulative.strip().isdigit():
+            times.append((int(cumulative), module.rstrip()))
+
+    times.sort(reverse=True)
+
+    return times[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the startup time of main.py.")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS,
+                        help=f"runs per scenario, default: {DEFAULT_RUNS}")
+    parser.add_argument("--imports", type=int, default=0,
+                        help="also show the slowest imports of every scenario")
+    args = parser.parse_args()
+
+    # Acquisitions are written in a throwaway directory
+    with tempfile.TemporaryDirectory() as cwd:
+        for name, scenario in SCENARIOS.items():
+            times = [time_run(scenario, cwd) for _ in range(args.runs)]
+
+            print(f"{name:<12}min {min(times) * 1000:8.1f} ms"
+                  + f"   median {statistics.median(times) * 1000:8.1f} ms")
+
+            for cumulative, module in import_times(scenario, cwd, args.imports):
+                print(f"    {cumulative / 1000:8.1f} ms {module}")
+
+
+if __name__ == "__main__":
+    main()
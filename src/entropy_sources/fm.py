@@ -1,15 +1,30 @@
 from entropy_sources.source import source
 
-from subprocess import run, Popen, PIPE, DEVNULL
+from subprocess import Popen, PIPE, DEVNULL
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from os import makedirs
 from os.path import join
+from queue import Empty, Queue
+
+import time
+import wave
+import numpy as np
 
 DEFAULT_FREQUENCYS = ['80M', '160M', '230M', '440M']
 BANDWIDTH = 200000
 
+# Times a failed recording is started again before its device is given up
+DEFAULT_RESTARTS = 3
+
+# Seconds to wait before restarting a recording, doubled after every failure
+RESTART_DELAY = 1
+
 
 class fm_source(source):
-    def __init__(self, freqs=DEFAULT_FREQUENCYS, gain='33.8', ppm='50', bw=BANDWIDTH, **kwargs):
+    def __init__(self, freqs=DEFAULT_FREQUENCYS, gain='33.8', ppm='50', bw=BANDWIDTH,
+                 devices=None, restarts=DEFAULT_RESTARTS, **kwargs):
         super().__init__(**kwargs)
 
         self.freqs = freqs
@@ -17,42 +32,160 @@ class fm_source(source):
         self.ppm = ppm
         self.bw = bw
 
+        # Indices of the RTL-SDR dongles, by default the first one found by rtl_fm
+        self.devices = [None] if devices is None else devices
+        self.restarts = restarts
+
     def acquire(self, duration):
         super().acquire(duration)
 
+        # Frequencies waiting for a free device
+        freqs = Queue()
         for freq in self.freqs:
-            self.fm_record(freq, str(duration))
-
-    def fm_record(self, freq, duration):
+            freqs.put(freq)
+
+        # Every device records on its own
+        with ThreadPoolExecutor(len(self.devices)) as executor:
+            futures = [
+                executor.submit(self.device_worker, device, freqs, duration)
+                for device in self.devices
+            ]
+
+        # Surface the errors of the devices
+        error = None
+        for device, future in zip(self.devices, futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Device {device} failed: {e}")
+                error = e
+
+        # No device was left to record these
+        missing = []
+        while not freqs.empty():
+            missing.append(freqs.get())
+
+        if len(missing) > 0:
+            raise Exception(f"Could not record {', '.join(missing)}, no working device left.") from error
+
+        if error is not None:
+            raise error
+
+    def device_worker(self, device, freqs, duration):
+        while True:
+            try:
+                freq = freqs.get_nowait()
+            except Empty:
+                return
+
+            try:
+                recorded = self.supervise(device, freq, duration)
+            except Exception:
+                # Another device may still record it
+                freqs.put(freq)
+                raise
+
+            if recorded:
+                continue
+
+            # The device keeps failing, let the others take its frequency
+            print(f"Giving up device {device}.")
+            freqs.put(freq)
+            return
+
+    def supervise(self, device, freq, duration):
+        delay = RESTART_DELAY
+
+        for attempt in range(self.restarts + 1):
+            if attempt > 0:
+                print(f"Restarting recording of {freq} on device {device}.")
+                time.sleep(delay)
+                delay *= 2
+
+            if self.fm_record(freq, duration, device):
+                return True
+
+        return False
+
+    def rtl_fm_command(self, freq, device=None):
         sr = (self.bw // self.sample_rate) * self.sample_rate
         sr = str(sr)
 
         # Set up the rtl_fm command to demodulate FM radio
-        rtl_fm_cmd = ['rtl_fm', '-M', 'fm', '-s', sr, '-r',
-                      f'{self.sample_rate}', '-A', 'lut', '-g', self.gain,
-                      '-p', self.ppm, '-f', freq]
+        cmd = ['rtl_fm', '-M', 'fm', '-s', sr, '-r',
+               f'{self.sample_rate}', '-A', 'lut', '-g', self.gain,
+               '-p', self.ppm, '-f', freq]
 
-        # Run the command and pipe the output to a file
-        radio = Popen(rtl_fm_cmd, stdout=PIPE, stderr=DEVNULL)
+        # Pick the dongle, if there are many
+        if device is not None:
+            cmd += ['-d', str(device)]
 
-        # Create the base directory for the acquisitions
-        audio_file = join(self.source_dir, f'{freq}.wav')
+        return cmd
 
-        # Set up the rtl_fm command to match the sampling rate with the resampling
-        # rate of the radio output and to use a single channel
-        # Also trim the time
-        sox_cmd = ['sox', '-t', 'raw', '-r', f'{self.sample_rate}', '-es',
-                   '-b', '16', '-c', '1', '-V0', '-', audio_file, 'trim', '0', duration]
+    def fm_record(self, freq, duration, device=None):
+        # Save the samples of the radio as they come, until the duration is reached
+        nr_samples = 0
+        for block in self.stream(freq, duration, persist=True, device=device):
+            nr_samples += len(block)
 
-        # Run the command and set the input to the last pipe
-        record = run(sox_cmd, stdin=radio.stdout, stderr=DEVNULL)
+        # Check for errors
+        if nr_samples < duration * self.sample_rate:
+            print(f"Could not record {freq} on device {device}.")
+            return False
 
-        # Allow the radio process to be terminated when the sox process is done
-        radio.stdout.close()
-        radio.wait()
+        print("Successful recording!")
+        return True
 
-        # Check for errors
-        if radio.returncode != 0 or record.returncode != 0:
-            print(f"Could not record. Radio return code {radio.returncode}.")
-        else:
-            print("Successful recording!")
+    def streams(self, duration, persist=False):
+        for freq in self.freqs:
+            yield f'{freq}.wav', self.stream(freq, duration, persist)
+
+    def stream(self, freq, duration=0, persist=False, device=None):
+        """
+        Yields the samples demodulated by rtl_fm, one block at a time, as soon
+        as they are received. A duration of 0 streams until interrupted.
+        """
+        block_size = self.stream_block_size()
+        nr_samples = duration * self.sample_rate
+
+        # The raw output of rtl_fm is 16-bit mono PCM
+        radio = Popen(self.rtl_fm_command(freq, device), stdout=PIPE, stderr=DEVNULL)
+
+        with ExitStack() as stack:
+            # Keep the raw samples along the way, if asked to
+            if persist:
+                makedirs(self.source_dir, exist_ok=True)
+
+                audio_file = join(self.source_dir, f'{freq}.wav')
+                wf = stack.enter_context(wave.open(audio_file, 'wb'))
+                wf.setnchannels(1)
+                wf.setsampwidth(2)
+                wf.setframerate(self.sample_rate)
+
+            try:
+                nr_streamed = 0
+
+                while duration == 0 or nr_streamed < nr_samples:
+                    # Do not read past the duration
+                    if duration != 0:
+                        block_size = min(block_size, nr_samples - nr_streamed)
+
+                    # Blocks until the whole block is received, or the radio stops
+                    data = radio.stdout.read(2 * block_size)
+                    if len(data) < 2:
+                        print(f"Radio stopped. Return code {radio.wait()}.")
+                        break
+
+                    block = np.frombuffer(data[:len(data) // 2 * 2], dtype='<i2').astype(np.int16)
+                    nr_streamed += len(block)
+
+                    if persist:
+                        wf.writeframes(block.tobytes())
+
+                    yield block
+
+            finally:
+                # The consumer may stop at any time, the radio has to stop with it
+                radio.stdout.close()
+                radio.terminate()
+                radio.wait()
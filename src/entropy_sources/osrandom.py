@@ -1,28 +1,69 @@
 from entropy_sources.source import source
 
+from utils.products import open_writer
+
 import numpy as np
-from scipy.io import wavfile
 
 from os.path import join
-from os import getrandom, GRND_RANDOM
+
+import time
+
+# Bytes in a sample
+SAMPLE_WIDTH = 2
+
+# Samples asked for at once, a few MB keep the memory use flat for hours long acquisitions
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# The pools of the kernel, read in place
+RANDOM_DEVICE = '/dev/random'
+URANDOM_DEVICE = '/dev/urandom'
 
 
 class osrandom_source(source):
-    def __init__(self, **kwargs):
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, urandom=False, **kwargs):
         super().__init__(**kwargs)
 
+        # Samples asked for at once, None asks for all of them in a single call
+        self.chunk_size = chunk_size
+
+        # The urandom pool never blocks, the random one may
+        self.urandom = urandom
+
     def acquire(self, duration):
         super().acquire(duration)
 
-        total_num = duration * self.sample_rate * 2
+        total_num = duration * self.sample_rate * SAMPLE_WIDTH
+        chunk_num = total_num if self.chunk_size is None else self.chunk_size * SAMPLE_WIDTH
 
-        byte_arr = getrandom(total_num, GRND_RANDOM)
-
-        # Convert the byte array to a NumPy array of 16-bit signed integers
-        data = np.frombuffer(byte_arr, dtype=np.int16)
+        device = URANDOM_DEVICE if self.urandom else RANDOM_DEVICE
 
         # Set the path of the file
         file = join(self.source_dir, 'osrandom.wav')
 
-        # Write the data to a new WAV file
-        wavfile.write(file, self.sample_rate, data)
+        # A single buffer, filled again for every chunk once the writer has copied it
+        buffer = memoryview(bytearray(chunk_num))
+
+        start = time.perf_counter()
+
+        # Write every chunk to the new WAV file while the next one is filled
+        with open(device, 'rb', buffering=0) as pool, \
+                open_writer(file, self.sample_rate, 1, SAMPLE_WIDTH) as writer:
+            for offset in range(0, total_num, chunk_num):
+                chunk = buffer[:min(chunk_num, total_num - offset)]
+                osrandom_source.fill(pool, chunk)
+                writer.write(np.frombuffer(chunk, dtype=np.int16))
+
+        elapsed = time.perf_counter() - start
+        print(f"Acquired {total_num / 1e6:.1f} MB in {elapsed:.2f} s, "
+              + f"{total_num / 1e6 / max(elapsed, 1e-9):.1f} MB/s.")
+
+    def fill(pool, view):
+        filled = 0
+
+        # The kernel may return fewer bytes than asked for
+        while filled < len(view):
+            nr_read = pool.readinto(view[filled:])
+            if not nr_read:
+                raise Exception(f"Could not read from {pool.name}")
+
+            filled += nr_read
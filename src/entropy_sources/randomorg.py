@@ -1,67 +1,141 @@
 from entropy_sources.source import source
 
 import numpy as np
-from scipy.io import wavfile
+
+from utils.data import write_wav
 
 from os.path import join
-from subprocess import check_output
+from concurrent.futures import ThreadPoolExecutor
+
+import time
+
+# requests is slow to import, it is loaded when acquiring
 
 INTEGERS_URL = 'https://www.random.org/integers/'
+QUOTA_URL = 'https://www.random.org/quota/'
 MAX_NUM = 10000
 
+# random.org asks clients not to send many requests at the same time
+DEFAULT_CONCURRENCY = 2
+
+# Times a failed request is sent again
+DEFAULT_RETRIES = 5
+
+# Seconds to wait before sending a failed request again, doubled after every failure
+RETRY_DELAY = 1
+
+# Bits of quota used by every 16-bit integer
+BITS_PER_NUM = 16
+
 
 class randomorg_source(source):
-    def __init__(self, **kwargs):
+    def __init__(self, url=INTEGERS_URL, quota_url=QUOTA_URL,
+                 concurrency=DEFAULT_CONCURRENCY, retries=DEFAULT_RETRIES, **kwargs):
         super().__init__(**kwargs)
 
+        self.url = url
+        self.quota_url = quota_url
+        self.concurrency = concurrency
+        self.retries = retries
+
     def acquire(self, duration):
         super().acquire(duration)
 
+        import requests
+        from requests.adapters import HTTPAdapter
+
         total_num = duration * self.sample_rate
-        data = np.array([], dtype=np.int16)
 
-        while total_num > 0:
-            total_num -= MAX_NUM
+        with requests.Session() as session:
+            # Keep one connection per request in flight
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+
+            # Do not ask for more than the service is willing to give
+            total_num = self.check_quota(session, total_num)
 
-            # Get a block of data
-            data_block = randomorg_source.get_data_block(MAX_NUM)
+            # Every block is written in its place, as soon as it arrives
+            data = np.empty(total_num, dtype=np.int16)
+            starts = range(0, total_num, MAX_NUM)
 
-            # Concatenate all blocks into one array
-            data = np.concatenate((data, data_block))
+            with ThreadPoolExecutor(self.concurrency) as executor:
+                futures = [
+                    executor.submit(self.get_data_block, session,
+                                    data[start:start + MAX_NUM])
+                    for start in starts
+                ]
+
+                # Surface the errors of the requests
+                for future in futures:
+                    future.result()
 
         # Set the path of the file
         file = join(self.source_dir, 'randomorg.wav')
 
         # Write the data to a new WAV file
-        wavfile.write(file, self.sample_rate, data)
+        write_wav(file, self.sample_rate, data)
+
+    def check_quota(self, session, total_num):
+        response = self.get(session, self.quota_url, {'format': 'plain'})
+
+        # Remaining bits for this address, it can be negative
+        quota = int(response.text.strip())
+        quota_num = max(0, quota // BITS_PER_NUM)
+
+        if quota_num == 0:
+            raise Exception(f"random.org quota exhausted: {quota} bits left")
+
+        if quota_num < total_num:
+            print(f"random.org quota allows only {quota_num} of {total_num} samples.")
+            return quota_num
 
-    def get_data_block(num):
+        return total_num
+
+    def get_data_block(self, session, out):
         min = np.iinfo(np.int16).min
         max = np.iinfo(np.int16).max
 
-        url = INTEGERS_URL + '?' + \
-            f'num={num}&min={min}&max={max}' + \
-            '&col=1&base=10&format=plain&rnd=new'
+        params = {'num': len(out), 'min': min, 'max': max,
+                  'col': 1, 'base': 10, 'format': 'plain', 'rnd': 'new'}
+
+        response = self.get(session, self.url, params)
+
+        # Parse all the numbers at once
+        arr = np.fromstring(response.content, dtype=np.int32, sep='\n')
+
+        if len(arr) != len(out):
+            raise Exception(f"random.org sent {len(arr)} numbers instead of {len(out)}")
+
+        out[:] = arr
 
-        # Send a GET request
-        curl_command = ['curl', '-s', url]
+    def get(self, session, url, params):
+        import requests
 
-        # Run the command and get the output
-        response = check_output(curl_command)
+        delay = RETRY_DELAY
 
-        # Convert the byte string content to a string
-        str_string = response.decode('utf-8')
+        for attempt in range(self.retries + 1):
+            try:
+                response = session.get(url, params=params, timeout=60)
+            except requests.RequestException as e:
+                error, wait = e, delay
+            else:
+                if response.status_code == 200:
+                    return response
 
-        # Split the string into individual numbers
-        str_list = str_string.split()
+                error = f"{response.status_code} {response.text.strip()}"
 
-        if not str_list[0].isnumeric():
-            return np.array([], dtype=np.int16)
+                # The service tells how long to back off, when it is busy
+                retry_after = response.headers.get('Retry-After', '')
+                wait = int(retry_after) if retry_after.isdigit() else delay
 
-        # Convert the list of strings to a list of integers
-        int_list = [int(i) for i in str_list]
+                # Other client errors will not go away
+                if 400 <= response.status_code < 500 and response.status_code != 429:
+                    break
 
-        # Convert the list of integers to a NumPy array of 16-bit signed integers
-        arr = np.array(int_list, dtype=np.int16)
+            if attempt < self.retries:
+                print(f"Request to {url} failed: {error}. Retrying in {wait} s.")
+                time.sleep(wait)
+                delay *= 2
 
-        return arr
+        raise Exception(f"Request to {url} failed: {error}")
@@ -3,7 +3,10 @@ from abc import ABC, abstractmethod
 from os.path import join
 from os import makedirs, listdir
 
-from scipy.io import wavfile
+from utils.riff import read_wav_header, truncate_wav
+
+# Samples acquired at once when streaming
+STREAM_BLOCK_SIZE = 4096
 
 
 class source(ABC):
@@ -21,48 +24,48 @@ class source(ABC):
         # Create the base directory for the acquisitions
         makedirs(self.source_dir, exist_ok=True)
 
+    def streams(self, duration, persist=False):
+        # Gives (name, blocks) pairs, for the sources that can be streamed
+        raise Exception(f"Source cannot be streamed: {type(self).__name__}")
+
+    def stream_block_size(self):
+        return self.block_size or STREAM_BLOCK_SIZE
+
     def source_trim_to_same_length(self):
         # Check that all the source files have the same size and sample rate
         min_size = None
-        sample_rate = None
 
-        # Get all files in the directory
-        files = listdir(self.source_dir)
+        # Get all wav files in the directory
+        files = [join(self.source_dir, file) for file in listdir(self.source_dir)
+                 if file.endswith(".wav")]
 
-        # Iterate through all wav files in the directory
-        for file in files:
-            if file.endswith(".wav"):
-                # Set the path
-                path = join(self.source_dir, file)
+        # Only the headers are needed to know the lengths
+        headers = [read_wav_header(path) for path in files]
 
-                # Load audio file
-                sample_rate, data = wavfile.read(path)
+        for header in headers:
+            if self.sample_rate is None:
+                self.sample_rate = header.frame_rate
+            else:
+                assert self.sample_rate == header.frame_rate, "Sample rates do not match"
 
-                if self.sample_rate is None:
-                    self.sample_rate = sample_rate
-                else:
-                    assert self.sample_rate == sample_rate, "Sample rates do not match"
+            # Update minimum size
+            if min_size is None or header.num_frames < min_size:
+                min_size = header.num_frames
 
-                if min_size is None:
-                    min_size = data.size
-
-                # Update minimum size
-                min_size = min(min_size, data.size)
+        if min_size is None:
+            return
 
         if self.block_size is not None:
             min_size -= min_size % self.block_size
 
         # Trim all files to minimum size
-        for file in files:
-            if file.endswith(".wav"):
-                # Set the path
-                path = join(self.source_dir, file)
-
-                # Load audio file
-                sample_rate, data = wavfile.read(path)
+        for path in files:
+            # Cut the end of the file, without touching the samples
+            if truncate_wav(path, min_size):
+                continue
 
-                # Trim audio file
-                data = data[:min_size]
+            # Other chunks follow the samples, rewrite the whole file
+            from scipy.io import wavfile
 
-                # Export trimmed audio file
-                wavfile.write(path, sample_rate, data)
+            sample_rate, data = wavfile.read(path)
+            wavfile.write(path, sample_rate, data[:min_size])
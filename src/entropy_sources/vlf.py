@@ -1,12 +1,19 @@
 from entropy_sources.source import source
 
+from utils.ring import ring_buffer
+
+from os import makedirs
 from os.path import join
 from concurrent.futures import ThreadPoolExecutor
-from subprocess import run, DEVNULL
+from contextlib import ExitStack
+from subprocess import Popen, PIPE, DEVNULL
 
 import re
-import requests
-from bs4 import BeautifulSoup
+import threading
+import wave
+import numpy as np
+
+# requests and bs4 are slow to import, they are loaded by the methods using them
 
 # URLs for VLF radio noise
 STREAMS_URL = 'http://abelian.org/vlf/live-stream.php?stream=vlf'
@@ -14,9 +21,22 @@ STREAMS_URL = 'http://abelian.org/vlf/live-stream.php?stream=vlf'
 # These hosts were active on abelian.org on June 2023
 DEFAULT_HOSTS = ['1', '15', '34', '35', '38', '41', '44']
 
+# Seconds of samples kept for every host, while waiting to be consumed
+RING_SECONDS = 10
+
+# Blocks kept at least, for block sizes longer than the seconds above
+RING_BLOCKS = 4
+
+# Seconds to wait before reconnecting to a host, doubled after every failure
+RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 60
+
+# Times a host is reconnected to without receiving anything, None never gives up
+DEFAULT_RECONNECTS = 5
+
 
 class vlf_source(source):
-    def __init__(self, hosts=None, **kwargs):
+    def __init__(self, hosts=None, url=STREAMS_URL, reconnects=DEFAULT_RECONNECTS, **kwargs):
         super().__init__(**kwargs)
 
         if hosts is None:
@@ -24,17 +44,158 @@ class vlf_source(source):
         else:
             self.hosts = list(map(str, hosts))
 
+        self.url = url
+        self.reconnects = reconnects
+
     def acquire(self, duration):
         super().acquire(duration)
 
-        # Download audio clips from all URLs in parallel
-        with ThreadPoolExecutor() as executor:
+        # Record all hosts in parallel
+        with ThreadPoolExecutor(len(self.hosts)) as executor:
             for host in self.hosts:
+                executor.submit(self.record_live, host, duration)
+
+    def record_live(self, host, duration):
+        # Save the samples of the host as they come, until the duration is reached
+        nr_samples = 0
+        for block in self.stream(host, duration, persist=True):
+            nr_samples += len(block)
+
+        # Check for errors
+        if nr_samples < duration * self.sample_rate:
+            print(f"Could not record host {host}, got {nr_samples} samples.")
+        else:
+            print("Successful download!")
+
+    def streams(self, duration, persist=False):
+        for host in self.hosts:
+            yield f'{host}.wav', self.stream(host, duration, persist)
+
+    def stream(self, host, duration=0, persist=False):
+        """
+        Yields the samples of a host, one block at a time, as soon as they
+        are received. A duration of 0 streams until interrupted.
+        """
+        block_size = self.stream_block_size()
+        nr_samples = duration * self.sample_rate
+
+        # The receiver fills the ring, the consumer empties it at its own pace
+        ring = ring_buffer(max(RING_SECONDS * self.sample_rate, RING_BLOCKS * block_size))
+        stop = threading.Event()
+
+        # The ffmpeg process of the current connection
+        connection = {}
+
+        receiver = threading.Thread(target=self.receive, args=(host, ring, stop, connection),
+                                    daemon=True)
+        receiver.start()
+
+        with ExitStack() as stack:
+            # Keep the raw samples along the way, if asked to
+            if persist:
+                makedirs(self.source_dir, exist_ok=True)
+
                 audio_file = join(self.source_dir, f'{host}.wav')
-                executor.submit(self.record_live, STREAMS_URL +
-                                host, duration, audio_file)
+                wf = stack.enter_context(wave.open(audio_file, 'wb'))
+                wf.setnchannels(1)
+                wf.setsampwidth(2)
+                wf.setframerate(self.sample_rate)
+
+            try:
+                nr_streamed = 0
+                nr_dropped = 0
+
+                while duration == 0 or nr_streamed < nr_samples:
+                    # Do not read past the duration
+                    if duration != 0:
+                        block_size = min(block_size, nr_samples - nr_streamed)
+
+                    # Blocks until the whole block is received, or the host is given up
+                    block = ring.read(block_size)
+                    if len(block) == 0:
+                        break
+
+                    # Samples were lost, the consumer is too slow
+                    if ring.nr_dropped > nr_dropped:
+                        print(f"Host {host}: dropped {ring.nr_dropped - nr_dropped} samples.")
+                        nr_dropped = ring.nr_dropped
+
+                    nr_streamed += len(block)
+
+                    if persist:
+                        wf.writeframes(block.tobytes())
+
+                    yield block
+
+            finally:
+                # The consumer may stop at any time, the receiver has to stop with it
+                stop.set()
+                if 'ffmpeg' in connection:
+                    connection['ffmpeg'].terminate()
+                receiver.join()
+
+    def ffmpeg_command(self, host):
+        # Decode the stream to raw 16-bit mono PCM on the standard output
+        return ['ffmpeg', '-nostdin', '-loglevel', 'error', '-i', self.url + host,
+                '-af', f'aresample={self.sample_rate}', '-ac', '1',
+                '-f', 's16le', '-acodec', 'pcm_s16le', '-']
+
+    def receive(self, host, ring, stop, connection):
+        delay = RECONNECT_DELAY
+        nr_failures = 0
+
+        try:
+            while not stop.is_set():
+                received = self.receive_once(host, ring, stop, connection)
+
+                if stop.is_set():
+                    break
+
+                # A connection that worked for a while starts the backoff over
+                if received:
+                    delay = RECONNECT_DELAY
+                    nr_failures = 0
+                else:
+                    nr_failures += 1
+
+                if self.reconnects is not None and nr_failures > self.reconnects:
+                    print(f"Giving up host {host}.")
+                    break
+
+                print(f"Host {host} disconnected, reconnecting in {delay} s.")
+                stop.wait(delay)
+                delay = min(2 * delay, MAX_RECONNECT_DELAY)
+        finally:
+            # Wake up the consumer
+            ring.close()
+
+    def receive_once(self, host, ring, stop, connection):
+        block_size = self.stream_block_size()
+        received = False
+
+        ffmpeg = Popen(self.ffmpeg_command(host), stdout=PIPE, stderr=DEVNULL)
+        connection['ffmpeg'] = ffmpeg
+
+        try:
+            while not stop.is_set():
+                # Blocks until the whole block is received, or the connection ends
+                data = ffmpeg.stdout.read(2 * block_size)
+                if len(data) < 2:
+                    break
+
+                ring.write(np.frombuffer(data[:len(data) // 2 * 2], dtype='<i2'))
+                received = True
+        finally:
+            ffmpeg.stdout.close()
+            ffmpeg.terminate()
+            ffmpeg.wait()
+
+        return received
 
     def get_live_hosts(live_url, streams_url):
+        import requests
+        from bs4 import BeautifulSoup
+
         # Send a GET request
         response = requests.get(live_url)
 
@@ -62,31 +223,10 @@ class vlf_source(source):
             print('An error occurred while trying to fetch the webpage.')
             return []
 
-    def record_live(self, url, duration, output):
-        assert isinstance(
-            duration, int) and duration > 0, "Duration must be a positive integer."
-
-        # Convert the duration in seconds to the format HH:MM:SS
-        hours = duration // 3600
-        minutes = (duration % 3600) // 60
-        seconds = duration % 60
-        duration_str = f"{hours:02}:{minutes:02}:{seconds:02}"
-
-        # Set up the ffmpeg command
-        cmd = ['ffmpeg', '-y', '-i', url, '-t', duration_str, '-af',
-               f'aresample={self.sample_rate}', '-sample_fmt', 's16',
-               '-ac', '1', '-f', 'wav', output]
-
-        # Run the command
-        result = run(cmd, stdout=DEVNULL, stderr=DEVNULL)
-
-        # Check for errors
-        if result.returncode != 0:
-            print(f"Error: {result.stderr.decode('utf-8')}")
-        else:
-            print("Successful download!")
-
     def store_last_event(self, host_nr, events_url, recordings_url):
+        import requests
+        from bs4 import BeautifulSoup
+
         # Send a GET request
         response = requests.get(events_url + str(host_nr))
 
@@ -5,42 +5,19 @@ import sys
 
 from argparse import RawTextHelpFormatter
 from functools import reduce
+from importlib import import_module
+from os import makedirs
 from os.path import join
 
-# Sources
-from entropy_sources.fm import fm_source
-from entropy_sources.osrandom import osrandom_source
-from entropy_sources.randomorg import randomorg_source
-from entropy_sources.vlf import vlf_source
-
-# Operations
-from operations.filter import (
-    filter_spectrum_average,
-    filter_spectrum_gaussian,
-    filter_spectrum_median,
-    filter_spectrum_notch,
-)
-from operations.miscellaneous import (
-    autocorrelate_signal,
-    autocorrelate_spectrum,
-    expand_band,
-    von_neumann
-)
-from operations.operation import operation
-from operations.outlier import winsorize_spectrum, winsorize_signal
-from operations.uniformize import (
-    uniformize_signal,
-    uniformize_spectrum_mean,
-    uniformize_spectrum_median,
-    uniformize_spectrum_maximum,
-)
-
 from strings import BANNER, SOURCE_FORMAT, OPERATIONS_FORMAT, PLOTS_FORMAT, TESTS_FORMAT
 
 # Plots and tests
 from plots import plot_type
 from tests import test_type
 
+from utils.instrument import instrument
+from utils.products import DEFAULT_PRODUCT_FORMAT, PRODUCT_FORMATS
+
 DEFAULT_DURATION = 5
 DEFAULT_SAMPLE_RATE = 32000
 
@@ -48,31 +25,45 @@ DEFAULT_AUDIO_DIR = "audio"
 DEFAULT_EVAL_DIR = "out"
 DEFAULT_SOURCE_DIR = "sources"
 
+DEFAULT_CACHE_SIZE_MB = 10 * 1024
+
+# Cost of every stage of a run, and their profiles, in the evaluation directory
+INSTRUMENT_FILE = "instrument.json"
+PROFILE_DIR = "profile"
+
+# Sources and operations are imported only when they are used,
+# as (module, class) pairs
 supported_sources = {
-    "vlf": vlf_source,
-    "fm": fm_source,
-    "randomorg": randomorg_source,
-    "osrandom": osrandom_source,
+    "vlf": ("entropy_sources.vlf", "vlf_source"),
+    "fm": ("entropy_sources.fm", "fm_source"),
+    "randomorg": ("entropy_sources.randomorg", "randomorg_source"),
+    "osrandom": ("entropy_sources.osrandom", "osrandom_source"),
 }
 
 supported_operations = {
-    "uniformize_signal": uniformize_signal,
-    "uniformize_spectrum_mean": uniformize_spectrum_mean,
-    "uniformize_spectrum_median": uniformize_spectrum_median,
-    "uniformize_spectrum_maximum": uniformize_spectrum_maximum,
-    "filter_spectrum_average": filter_spectrum_average,
-    "filter_spectrum_gaussian": filter_spectrum_gaussian,
-    "filter_spectrum_median": filter_spectrum_median,
-    "filter_spectrum_notch": filter_spectrum_notch,
-    "winsorize_spectrum": winsorize_spectrum,
-    "winsorize_signal": winsorize_signal,
-    "autocorrelate_signal": autocorrelate_signal,
-    "autocorrelate_spectrum": autocorrelate_spectrum,
-    "expand_band": expand_band,
-    "von_neumann": von_neumann,
+    "uniformize_signal": ("operations.uniformize", "uniformize_signal"),
+    "uniformize_spectrum_mean": ("operations.uniformize", "uniformize_spectrum_mean"),
+    "uniformize_spectrum_median": ("operations.uniformize", "uniformize_spectrum_median"),
+    "uniformize_spectrum_maximum": ("operations.uniformize", "uniformize_spectrum_maximum"),
+    "filter_spectrum_average": ("operations.filter", "filter_spectrum_average"),
+    "filter_spectrum_gaussian": ("operations.filter", "filter_spectrum_gaussian"),
+    "filter_spectrum_median": ("operations.filter", "filter_spectrum_median"),
+    "filter_spectrum_notch": ("operations.filter", "filter_spectrum_notch"),
+    "winsorize_spectrum": ("operations.outlier", "winsorize_spectrum"),
+    "winsorize_signal": ("operations.outlier", "winsorize_signal"),
+    "autocorrelate_signal": ("operations.miscellaneous", "autocorrelate_signal"),
+    "autocorrelate_spectrum": ("operations.miscellaneous", "autocorrelate_spectrum"),
+    "expand_band": ("operations.miscellaneous", "expand_band"),
+    "von_neumann": ("operations.miscellaneous", "von_neumann"),
+    "health_test": ("operations.health", "health_test"),
 }
 
 
+def load_constructor(path):
+    module, name = path
+    return getattr(import_module(module), name)
+
+
 def make_plot_types(args) -> plot_type:
     # Construct Abstract Syntax Tree
     tree = ast.parse(args.plots, mode="eval")
@@ -143,7 +134,7 @@ def make_source(args):
     # Get the constructor for the source
     name = tree.body.func.id
     if name in supported_sources:
-        constructor = supported_sources[name]
+        constructor = load_constructor(supported_sources[name])
     else:
         raise Exception(f"Unknown source: {name}")
 
@@ -162,11 +153,15 @@ def make_source(args):
     return constructor(**kwargs)
 
 
-def make_operations(args, source) -> list[operation]:
+def make_operations(args, source) -> list["operation"]:
     # If no name is given: let the name of the operations be the same as the operations applied
     if args.name == "":
         args.name = args.operations
 
+    # Fused spectral operations give other products, they must not mix
+    if args.fuse_spectral:
+        args.name += "-fused"
+
     # Set the directories for the operations
     base_product = join(args.audio_dir, args.name)
     base_eval = join(args.eval_dir, args.name)
@@ -176,6 +171,8 @@ def make_operations(args, source) -> list[operation]:
         "audio_dir": source.source_dir,
         "block_size": args.block_size,
         "sample_rate": source.sample_rate,
+        "product_format": args.product_format,
+        "fuse_spectral": args.fuse_spectral,
     }
 
     # Construct Abstract Syntax Tree
@@ -214,7 +211,7 @@ def make_operations(args, source) -> list[operation]:
         # Get the constructor for the operation
         name = op.func.id
         if name in supported_operations:
-            constructor = supported_operations[name]
+            constructor = load_constructor(supported_operations[name])
         else:
             raise Exception(f"Unknown operation: {name}")
 
@@ -237,6 +234,16 @@ def make_operations(args, source) -> list[operation]:
     return operations
 
 
+def evaluate(stats, plot_types, test_types, audio_dir, eval_dir):
+    if plot_types & ~plot_type.NONE:
+        with stats.stage(f"plots {audio_dir}", [audio_dir]):
+            plot_types.execute(audio_dir, eval_dir)
+
+    if test_types & ~test_type.NONE:
+        with stats.stage(f"tests {audio_dir}", [audio_dir]):
+            test_types.execute(audio_dir, eval_dir)
+
+
 def compute(args):
     # Extract what evaluations need to be done
     plot_types = make_plot_types(args)
@@ -245,38 +252,86 @@ def compute(args):
     # Create the entropy source
     source = make_source(args)
 
+    # Streamed data goes straight through the operations
+    if args.stream and args.operations is None:
+        raise Exception("Streaming needs operations to apply")
+
+    # Keep track of where the time goes, even if the run fails
+    stats = instrument(join(args.eval_dir, PROFILE_DIR) if args.profile else None)
+
+    try:
+        compute_stages(args, source, plot_types, test_types, stats)
+    finally:
+        makedirs(args.eval_dir, exist_ok=True)
+        stats.write(join(args.eval_dir, INSTRUMENT_FILE))
+
+
+def compute_stages(args, source, plot_types, test_types, stats):
     # Verify if there is a need to acquire data
-    if args.acquire:
-        source.acquire(args.duration)
-        plot_types.execute(source.source_dir, source.eval_dir)
-        test_types.execute(source.source_dir, source.eval_dir)
+    if args.acquire and not args.stream:
+        with stats.stage("acquire", output_dirs=[source.source_dir]):
+            source.acquire(args.duration)
+
+        evaluate(stats, plot_types, test_types, source.source_dir, source.eval_dir)
 
     # Verify if all the sources are in the same format
     if (args.source_trim_to_same_length):
-        source.source_trim_to_same_length()
+        with stats.stage("trim", [source.source_dir]):
+            source.source_trim_to_same_length()
 
     # Verify if there is a need to apply operations
     if args.operations is None:
         return
 
+    from operations.pipeline import pipeline
+
     # Extract the operations that need to be applied
     operations = make_operations(args, source)
 
-    # Iterate over the operations
-    for op in operations:
-        # Execute the operation
-        op.execute()
+    # Intermediate products are only needed if they are evaluated
+    evaluate_intermediate = not args.evaluate_only_last_operation and (
+        plot_types != plot_type.NONE or test_types != test_type.NONE
+    )
 
-        last_op = op
+    # Stream the data through all the operations at once
+    # Some tests are computed while the products are written
+    streamed_tests = test_types.streamed()
+    source_tests = test_types
+    test_types = test_types & ~streamed_tests
+
+    # Reuse the products of earlier runs
+    cache = None
+    if args.cache_dir is not None:
+        from utils.cache import product_cache
+        cache = product_cache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+    with pipeline(
+        operations,
+        materialize_intermediate=evaluate_intermediate,
+        batch_size=args.batch_size,
+        monitors=lambda op, file: streamed_tests.monitors(op.eval_dir, file) + stats.monitors(op),
+        cache=cache,
+    ) as p, stats.stage("operations", [source.source_dir], [op.product_dir for op in operations]):
+        if args.stream:
+            for name, blocks in source.streams(args.duration, args.persist_stream):
+                p.execute_stream(name, blocks, source.sample_rate, source.stream_block_size())
+        else:
+            p.execute()
 
-        # Evaluate the results if we should for intermediate stages
-        if not args.evaluate_only_last_operation:
-            plot_types.execute(op.product_dir, op.eval_dir)
-            test_types.execute(op.product_dir, op.eval_dir)
+    # Whether the disk kept up with the workers
+    stats.add_writes(p.write_stats)
 
-    if args.evaluate_only_last_operation:
-        plot_types.execute(last_op.product_dir, last_op.eval_dir)
-        test_types.execute(last_op.product_dir, last_op.eval_dir)
+    # The raw data of the streams is evaluated once complete
+    if args.stream and args.persist_stream:
+        evaluate(stats, plot_types, source_tests, source.source_dir, source.eval_dir)
+
+    # Evaluate the results if we should for intermediate stages
+    if evaluate_intermediate:
+        for op in operations[:-1]:
+            evaluate(stats, plot_types, test_types, op.product_dir, op.eval_dir)
+
+    last_op = operations[-1]
+    evaluate(stats, plot_types, test_types, last_op.product_dir, last_op.eval_dir)
 
 
 def add_arguments(parser: argparse.ArgumentParser):
@@ -299,6 +354,26 @@ def add_arguments(parser: argparse.ArgumentParser):
         help="whether or not to acquire data from the source",
     )
 
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="feed the data of the source to the operations while it is acquired,\n"
+        + "block by block, a duration of 0 streams until interrupted",
+    )
+
+    parser.add_argument(
+        "--persist_stream",
+        action="store_true",
+        help="also keep the raw data of the stream in the source directory",
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=f"dump a cProfile of every stage in {PROFILE_DIR}/ of the evaluation directory,\n"
+        + f"next to the {INSTRUMENT_FILE} summary of the run",
+    )
+
     parser.add_argument(
         "--acquisition_sample_rate",
         action="store",
@@ -351,6 +426,14 @@ def add_arguments(parser: argparse.ArgumentParser):
         help="the dimension on which the data is processed, block by block",
     )
 
+    parser.add_argument(
+        "--batch_size",
+        action="store",
+        type=int,
+        help="the number of blocks processed at once by operations that support batches,\n"
+        + "default: about a million samples per batch",
+    )
+
     available_plots = map(lambda x: "- " + x.lower(), plot_type.__members__.keys())
     available_plots = "\n    ".join(available_plots)
     parser.add_argument(
@@ -377,6 +460,44 @@ def add_arguments(parser: argparse.ArgumentParser):
         + f"\n\n{TESTS_FORMAT}",
     )
 
+    parser.add_argument(
+        "--product_format",
+        action="store",
+        choices=list(PRODUCT_FORMATS),
+        default=DEFAULT_PRODUCT_FORMAT,
+        help="how the products of the operations are stored:\n"
+        + "    - wav: audio, with the sample width of the input\n"
+        + "    - raw: only the packed samples, for tools that read bytes\n"
+        + "    - npy: a numpy array, in the dtype of the operation\n"
+        + "    - chunked: the samples and the length of every block, for variable-length output\n"
+        + f"default: {DEFAULT_PRODUCT_FORMAT}",
+    )
+
+    parser.add_argument(
+        "--fuse_spectral",
+        action="store_true",
+        help="keep consecutive spectral operations in the frequency domain, only the last\n"
+        + "one of a run rounds the signal to 16 bits, the products differ from the\n"
+        + "unfused ones and get the -fused suffix",
+    )
+
+    parser.add_argument(
+        "--cache_dir",
+        action="store",
+        type=str,
+        help="directory to keep the products of operations in, so that later runs\n"
+        + "with the same sources and operations reuse them, default: no cache",
+    )
+
+    parser.add_argument(
+        "--cache_size",
+        action="store",
+        default=DEFAULT_CACHE_SIZE_MB,
+        type=int,
+        help="the size (in MB) above which the least recently used products are\n"
+        + f"removed from the cache, default: {DEFAULT_CACHE_SIZE_MB}",
+    )
+
     parser.add_argument(
         "--evaluation_dir",
         dest="eval_dir",
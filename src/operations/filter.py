@@ -1,24 +1,22 @@
-from operations.operation import operation
+from operations.operation import operation, spectral_operation
 from abc import abstractmethod
 
 import numpy as np
 from scipy.signal import convolve, medfilt
 from scipy.signal import iirnotch, lfilter
 from scipy.stats import norm
-from scipy.fft import rfft, irfft
 
 PILOT_FREQ = 19000
 
 
-class filter_spectrum_magnitudes(operation):
+class filter_spectrum_magnitudes(spectral_operation):
+    batchable = True
+
     @abstractmethod
     def filter_magnitudes(self, magnitudes):
         pass
 
-    def blocks_func(self, data):
-        # Take FFT
-        spectrum = rfft(data)
-
+    def spectrum_func(self, spectrum):
         # Compute the magnitudes and phases of the spectrum
         magnitudes = np.abs(spectrum)
         phases = np.angle(spectrum)
@@ -27,13 +25,7 @@ class filter_spectrum_magnitudes(operation):
         filtered_magnitudes = self.filter_magnitudes(magnitudes)
 
         # Retain original phases
-        filtered_spectrum = np.multiply(filtered_magnitudes, np.exp(1j*phases))
-
-        # Inverse FFT
-        filtered_data = np.real(irfft(filtered_spectrum))
-
-        # Normalize and scale the transformed data to the range of 16-bit signed integers
-        return operation.normalize_and_scale(filtered_data)
+        return np.multiply(filtered_magnitudes, np.exp(1j*phases))
 
 
 class filter_spectrum_linear(filter_spectrum_magnitudes):
@@ -42,8 +34,11 @@ class filter_spectrum_linear(filter_spectrum_magnitudes):
         self.kernel = kernel
 
     def filter_magnitudes(self, magnitudes):
+        # Filter each row of a batch on its own
+        kernel = self.kernel.reshape((1,) * (magnitudes.ndim - 1) + (-1,))
+
         # Apply linear filter to the magnitudes of the spectrum
-        return convolve(magnitudes, self.kernel, mode='same')
+        return convolve(magnitudes, kernel, mode='same')
 
 
 class filter_spectrum_average(filter_spectrum_linear):
@@ -82,11 +77,20 @@ class filter_spectrum_median(filter_spectrum_magnitudes):
         self.window_size = window_size
 
     def filter_magnitudes(self, magnitudes):
+        # Filter each row of a batch on its own, the N-D median filter is much slower
+        rows = magnitudes.reshape(-1, magnitudes.shape[-1])
+        filtered = np.empty_like(rows)
+
         # Apply median filter to the magnitudes spectrum
-        return medfilt(magnitudes, self.window_size)
+        for i, row in enumerate(rows):
+            filtered[i] = medfilt(row, self.window_size)
+
+        return filtered.reshape(magnitudes.shape)
 
 
 class filter_spectrum_notch(operation):
+    batchable = True
+
     # notch_freq is the frequency to be removed
     # Q is the quality factor - higher values mean a narrower stop-band
     def __init__(self, notch_freq=PILOT_FREQ, Q=100, **kwargs):
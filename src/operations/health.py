@@ -0,0 +1,112 @@
+from operations.operation import operation
+
+import numpy as np
+from scipy.stats import binom
+
+# False positive probability of the tests, as recommended by SP 800-90B
+DEFAULT_ALPHA = 2 ** -20
+
+# Window of the adaptive proportion test, for non-binary samples
+APT_WINDOW = 512
+
+HEALTH_ACTIONS = ("drop", "raise", "warn")
+
+
+def repetition_count_cutoff(min_entropy, alpha):
+    return 1 + int(np.ceil(-np.log2(alpha) / min_entropy))
+
+
+def adaptive_proportion_cutoff(min_entropy, alpha, window=APT_WINDOW):
+    return 1 + int(binom.ppf(1 - alpha, window, 2.0 ** -min_entropy))
+
+
+class health_test(operation):
+    # Runs and windows go on from one block to the next
+    carries_state = True
+
+    # The blocks are only looked at, sending them to the workers would be wasted
+    uses_workers = False
+
+    def __init__(self, min_entropy=1, alpha=DEFAULT_ALPHA, action="drop", **kwargs):
+        super().__init__(**kwargs)
+
+        if action not in HEALTH_ACTIONS:
+            raise ValueError(f"Unknown health test action: {action}")
+
+        self.action = action
+
+        # Blocks that fail are left out of the product
+        self.preserves_length = action != "drop"
+
+        # Cutoffs for the claimed min-entropy per sample
+        self.rct_cutoff = repetition_count_cutoff(min_entropy, alpha)
+        self.apt_cutoff = adaptive_proportion_cutoff(min_entropy, alpha)
+
+    def blocks_func(self, data):
+        # The tests need the previous blocks, they run in join_blocks
+        return data
+
+    def join_blocks(self, blocks):
+        """
+        Runs the repetition count and adaptive proportion tests on every
+        block, as it comes out of the workers.
+        """
+        # Last sample and the length of its run
+        last = None
+        run = 0
+
+        # Samples of the current adaptive proportion window
+        window = np.array([], dtype=np.int64)
+
+        for i, block in enumerate(blocks):
+            samples = np.asarray(block).reshape(-1)
+
+            if len(samples) == 0:
+                yield block
+                continue
+
+            # Step 1: Length of every run of identical samples
+            starts = np.flatnonzero(samples[1:] != samples[:-1]) + 1
+            lengths = np.diff(np.concatenate(([0], starts, [len(samples)])))
+
+            # The first run may continue the last one of the previous block
+            if last is not None and samples[0] == last:
+                lengths[0] += run
+
+            rct_failed = lengths.max() >= self.rct_cutoff
+
+            last = samples[-1]
+            run = lengths[-1]
+
+            # Step 2: Occurrences of the first sample of every complete window
+            window = np.concatenate((window, samples))
+            nr_windows = len(window) // APT_WINDOW
+
+            windows = window[:nr_windows * APT_WINDOW].reshape(nr_windows, APT_WINDOW)
+            counts = np.count_nonzero(windows == windows[:, :1], axis=1)
+
+            apt_failed = nr_windows > 0 and counts.max() >= self.apt_cutoff
+
+            window = window[nr_windows * APT_WINDOW:]
+
+            if not rct_failed and not apt_failed:
+                yield block
+                continue
+
+            # Step 3: Sound the alarm
+            failed = [
+                name
+                for name, f in [("repetition count", rct_failed), ("adaptive proportion", apt_failed)]
+                if f
+            ]
+            message = f"Health test failed on block {i} ({', '.join(failed)})"
+
+            if self.action == "raise":
+                raise RuntimeError(message)
+
+            if self.action == "drop":
+                print(f"{message}, dropped.")
+                continue
+
+            print(f"{message}.")
+            yield block
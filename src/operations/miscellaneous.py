@@ -1,7 +1,6 @@
-from operations.operation import operation
+from operations.operation import operation, spectral_operation
 
 import numpy as np
-from scipy.fft import rfft, irfft
 from scipy.signal import convolve
 from scipy.ndimage import zoom
 
@@ -13,21 +12,13 @@ class autocorrelate_signal(operation):
         return convolve(data, data[::-1], mode='same')
 
 
-class autocorrelate_spectrum(operation):
-    def blocks_func(self, data):
-        # Compute the Fourier transform
-        spectrum = rfft(data)
-
-        auto_corr_spectrum = convolve(spectrum, spectrum[::-1], mode='same')
-
-        # Inverse FFT
-        adjusted_data = np.real(irfft(auto_corr_spectrum))
-
-        # Normalize and scale the transformed data to the range of 16-bit signed integers
-        return operation.normalize_and_scale(adjusted_data)
+class autocorrelate_spectrum(spectral_operation):
+    def spectrum_func(self, spectrum):
+        return convolve(spectrum, spectrum[::-1], mode='same')
 
 
-class expand_band(operation):
+class expand_band(spectral_operation):
+    # Not batchable, zoom is about twice as slow on a stack of blocks than on each one
     def __init__(self, band=DEFAULT_BAND, order=5, **kwargs):
         super().__init__(**kwargs)
 
@@ -37,49 +28,93 @@ class expand_band(operation):
             self.get_fft_index(band[0]),
             self.get_fft_index(band[1]))
 
-    def blocks_func(self, data):
-        # Compute the Fourier transform
-        spectrum = rfft(data)
-
+    def spectrum_func(self, spectrum):
         # Extract the spectrum in the band of interest
-        band_spectrum = spectrum[self.band_idx[0]:self.band_idx[1]]
+        band_spectrum = spectrum[..., self.band_idx[0]:self.band_idx[1]]
 
         # Calculate the zoom factor
-        zoom_factor = spectrum.size / band_spectrum.size
+        zoom_factor = spectrum.shape[-1] / band_spectrum.shape[-1]
 
         # Interpolate the spectrum in the band of interest
-        enlarged_spectrum = zoom(band_spectrum, zoom_factor, order=self.order)
+        return zoom(band_spectrum, zoom_factor, order=self.order)
+
 
-        # Inverse FFT
-        adjusted_data = np.real(irfft(enlarged_spectrum))
+def von_neumann_tables():
+    # Split every possible byte in its four pairs of bits, MSB first
+    pairs = (np.arange(256)[:, None] >> np.array([6, 4, 2, 0])) & 0b11
+
+    # 01 gives a 0, 10 gives a 1, 00 and 11 give nothing
+    bits = (pairs == 0b10).astype(np.uint8)
+    valid = (pairs == 0b01) | (pairs == 0b10)
+
+    return bits, valid
+
+
+VN_BITS, VN_VALID = von_neumann_tables()
 
-        # Normalize and scale the transformed data to the range of 16-bit signed integers
-        return operation.normalize_and_scale(adjusted_data)
 
 class von_neumann(operation):
+    # The number of unbiased bits depends on the data
+    preserves_length = False
+
+    # The blocks are flattened anyway, so batches are just longer streams
+    batchable = True
+
+    # Bits that do not fill a sample are carried to the next block
+    carries_state = True
+
     def blocks_func(self, data):
         """
-        Applies Von Neumann bias correction to a numpy array of uint16 values
-        and returns a new numpy array of uint16 with unbiased bits.
+        Applies Von Neumann bias correction to a numpy array of uint16 values.
+        Returns the unbiased bits packed in whole bytes, MSB first, and the
+        leftover bits as a value and their number, fewer than 8.
         """
-        # Step 1: Extract bits (MSB to LSB)
-        bits = ((data[:, None] >> np.arange(15, -1, -1)) & 1).astype(np.uint8).flatten()
-
-        # Step 2: Apply Von Neumann correction
-        if len(bits) % 2 != 0:
-            bits = bits[:-1]  # discard last bit if odd number
-
-        pairs = bits.reshape(-1, 2)
-        b0, b1 = pairs[:, 0], pairs[:, 1]
-        corrected = np.where((b0 == 0) & (b1 == 1), 0,
-                     np.where((b0 == 1) & (b1 == 0), 1, -1))
-        corrected = corrected[corrected != -1]
-
-        # Step 3: Pack back into uint16s
-        usable_len = (len(corrected) // 16) * 16
-        if usable_len == 0:
-            return np.array([], dtype=np.uint16)
-
-        packed_bits = corrected[:usable_len].reshape(-1, 16)
-        powers = 2 ** np.arange(15, -1, -1)
-        return np.dot(packed_bits, powers).astype(np.uint16)
+        # Step 1: View the samples as bytes, MSB first
+        data = np.ascontiguousarray(data, dtype=">u2").reshape(-1).view(np.uint8)
+
+        # Step 2: Look up the output bits of every byte
+        bits = VN_BITS[data][VN_VALID[data]]
+
+        # Step 3: Pack the whole bytes here, only they are sent back
+        usable_len = (len(bits) // 8) * 8
+        tail = bits[usable_len:]
+        tail_value = int(np.packbits(tail)[0]) >> (8 - len(tail)) if len(tail) > 0 else 0
+
+        return np.packbits(bits[:usable_len]), tail_value, len(tail)
+
+    def join_blocks(self, blocks):
+        """
+        Joins the packed bits of consecutive blocks into uint16 values,
+        keeping the leftover bits and bytes for the next block.
+        """
+        # Bits that do not fill a byte, and a byte that does not fill a sample
+        carry = 0
+        nr_carried = 0
+        pending = np.array([], dtype=np.uint8)
+
+        for packed, tail_value, tail_len in blocks:
+            # Step 4: Shift the bytes of the block after the carried bits
+            if nr_carried > 0 and len(packed) > 0:
+                previous = np.concatenate(([carry], packed[:-1])).astype(np.uint16)
+                shifted = ((previous << (8 - nr_carried)) & 0xFF) | (packed >> nr_carried)
+
+                carry = int(packed[-1]) & ((1 << nr_carried) - 1)
+                packed = shifted.astype(np.uint8)
+
+            # Then the leftover bits of the block
+            carry = (carry << tail_len) | tail_value
+            nr_carried += tail_len
+
+            if nr_carried >= 8:
+                nr_carried -= 8
+                packed = np.append(packed, np.uint8(carry >> nr_carried))
+                carry &= (1 << nr_carried) - 1
+
+            # Step 5: Pack back into uint16s
+            data = np.concatenate((pending, packed))
+            usable_len = (len(data) // 2) * 2
+            pending = data[usable_len:]
+
+            yield data[:usable_len].view(">u2").astype(np.uint16)
+
+        # The last few bits cannot fill a sample, they are dropped
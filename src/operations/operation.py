@@ -1,21 +1,42 @@
 from abc import ABC, abstractmethod
+from contextlib import ExitStack
 
-from os.path import join
-from os import makedirs, listdir
-
-import wave
+from os.path import exists, join
+from os import makedirs, remove
 
 from multiprocessing import Pool
 from itertools import combinations
 
 import numpy as np
-from utils.lazy import lazy_wav_blocks
-
-BUFFER_SIZE_MB = 100
+from scipy.fft import rfft, irfft
+from utils.lazy import batch_blocks
+from utils.products import (
+    DEFAULT_PRODUCT_FORMAT, check_product_format, list_products, open_product, open_writer,
+    product_name
+)
+from utils.writer import merge_stats
+
+# Every product is written from DEFAULT_NR_BUFFERS buffers of this size
+BUFFER_SIZE_MB = 32
 BUFFER_SIZE_BYTES = BUFFER_SIZE_MB * 1024 * 1024
 
+# Approximate number of samples in a batch of blocks
+BATCH_SIZE_SAMPLES = 1024 * 1024
+
 
 class operation(ABC):
+    # Whether each output block has as many samples as its input block
+    preserves_length = True
+
+    # Whether blocks_func also accepts a stack of blocks, one per row
+    batchable = False
+
+    # Whether join_blocks keeps state from one block to the next
+    carries_state = False
+
+    # Whether blocks_func does any work, the others only run join_blocks in the main process
+    uses_workers = True
+
     # Use keyworded arguments to allow for more flexibility
     def __init__(
         self,
@@ -25,6 +46,8 @@ class operation(ABC):
         block_size=None,
         nr_inputs=1,
         sample_rate=None,
+        product_format=DEFAULT_PRODUCT_FORMAT,
+        fuse_spectral=False,
     ):
         self.audio_dir = audio_dir
         self.product_dir = product_dir
@@ -34,6 +57,14 @@ class operation(ABC):
         self.nr_inputs = nr_inputs
         self.sample_rate = sample_rate
 
+        # How the products are stored, see utils.products
+        check_product_format(product_format)
+        self.product_format = product_format
+
+        # Whether a spectral operation hands its spectrum to the next one, without
+        # rounding it to 16 bits, see operations.pipeline
+        self.fuse_spectral = fuse_spectral
+
     # This is the function that will be applied to each combination of blocks
     @abstractmethod
     def blocks_func(self, **args):
@@ -42,12 +73,17 @@ class operation(ABC):
     def blocks_func_tuple(self, args):
         return self.blocks_func(*args)
 
-    def execute(self):
-        # Get all wav files in the directory
-        wavs = list(filter(lambda f: f.endswith(".wav"), listdir(self.audio_dir)))
+    # This is applied in order to the results of blocks_func, in the main process
+    def join_blocks(self, blocks):
+        return blocks
+
+    def execute(self, pool=None, func=None, batch_size=None, monitors=None, write_stats=None):
+        # Without a shared pool, the operation is sent along with every task
+        if func is None:
+            func = self.blocks_func_tuple
 
-        # Sort the files
-        wavs.sort()
+        # Get all the products in the directory, sorted
+        wavs = list_products(self.audio_dir)
 
         # If wavs is empty
         if len(wavs) == 0:
@@ -63,9 +99,12 @@ class operation(ABC):
             files = list(map(lambda f: join(self.audio_dir, f), t))
 
             # Check that all files have the same sample rate and number of frames
-            sample_rate, nframes, nchannels, sampwidth = operation.check_wav_files(
-                files
-            )
+            sample_rate, nframes, nchannels, sampwidth = operation.check_files(files)
+
+            # Samples without a known rate keep the one of the operation
+            if sample_rate is None and nframes is not None:
+                sample_rate = self.sample_rate
+
             flag = (
                 sample_rate is not None
                 and nframes is not None
@@ -79,77 +118,96 @@ class operation(ABC):
                 self.block_size = nframes
 
             # Evaluate blocks as needed
-            lazy_wavs = map(lambda f: lazy_wav_blocks(f, self.block_size), files)
+            lazy_wavs = map(lambda f: open_product(f, self.block_size), files)
+
+            # Stack the blocks in batches, if the operation can handle them
+            batched = self.batchable and nchannels == 1 and self.block_size > 0
+            chunk_size = 100
+
+            if batched:
+                if batch_size is None:
+                    batch_size = max(1, BATCH_SIZE_SAMPLES // self.block_size)
+
+                lazy_wavs = map(lambda w: batch_blocks(w, self.block_size, batch_size), lazy_wavs)
+
+                # A batch is already a large task
+                chunk_size = 1
 
             # Zip to get block tuples (lazily)
             block_tuples = zip(*lazy_wavs)
 
-            # Output WAV file path
-            product_file = join(self.product_dir, "-".join(t))
+            # Output file path
+            product_file = join(self.product_dir, product_name("-".join(t), self.product_format))
 
-            buffer = bytearray()
+            # The product may be a link to a cached one, which must not change
+            if exists(product_file):
+                remove(product_file)
 
-            # Open wave file for writing
-            with wave.open(product_file, "wb") as wf:
-                wf.setnchannels(nchannels)
-                wf.setsampwidth(sampwidth)
-                wf.setframerate(sample_rate)
+            # Objects that look at the product while it is written
+            file_monitors = [] if monitors is None else monitors(self, "-".join(t))
 
+            # Open the product for writing
+            with open_writer(product_file, sample_rate, nchannels, sampwidth,
+                             BUFFER_SIZE_BYTES) as writer:
                 # Process in parallel, lazily
-                with Pool() as pool:
-                    for block in pool.imap(self.blocks_func_tuple, block_tuples, chunksize=100):
-                        buffer.extend(block.tobytes())
+                with ExitStack() as stack:
+                    if pool is None:
+                        task_pool = stack.enter_context(Pool())
+                    else:
+                        task_pool = pool
+
+                    blocks = task_pool.imap(func, block_tuples, chunksize=chunk_size)
+
+                    for block in self.join_blocks(blocks):
+                        writer.write(block)
 
-                        # If buffer exceeds threshold, write to file
-                        if len(buffer) >= BUFFER_SIZE_BYTES:
-                            wf.writeframes(buffer)
-                            buffer.clear()
+                        for monitor in file_monitors:
+                            monitor.update(block)
 
-                    wf.writeframes(buffer)
+            # How long the results waited for the disk
+            merge_stats(write_stats, self.product_dir, writer.stats())
 
-    def check_wav_files(files):
+            # The product is complete
+            for monitor in file_monitors:
+                monitor.close()
+
+    def check_files(files):
         # Sample rate and number of frames of the first file
         sample_rate = None
         nframes = None
         nchannels = None
         sampwidth = None
 
-        for file in files:
-            with wave.open(file, "rb") as audio_file:
-                if sample_rate is None:
-                    sample_rate = audio_file.getframerate()
-                elif sample_rate != audio_file.getframerate():
-                    # Sample rates do not match
-                    return None, None
-
-                if nframes is None:
-                    nframes = audio_file.getnframes()
-                elif nframes != audio_file.getnframes():
-                    # Number of frames do not match
-                    return None, None
-
-                if nchannels is None:
-                    nchannels = audio_file.getnchannels()
-                elif nchannels != audio_file.getnchannels():
-                    # Number of channels do not match
-                    return None, None
-
-                if sampwidth is None:
-                    sampwidth = audio_file.getsampwidth()
-                elif sampwidth != audio_file.getsampwidth():
-                    # Data sizes do not match
-                    return None, None
+        for i, file in enumerate(files):
+            # Only the header is read
+            product = open_product(file)
+
+            if i == 0:
+                sample_rate = product.frame_rate
+                nframes = product.num_frames
+                nchannels = product.num_channels
+                sampwidth = product.sample_width
+            elif (
+                sample_rate != product.frame_rate
+                or nframes != product.num_frames
+                or nchannels != product.num_channels
+                or sampwidth != product.sample_width
+            ):
+                # Formats do not match
+                return None, None, None, None
 
         # Return all info
         return sample_rate, nframes, nchannels, sampwidth
 
     def normalize_and_scale(data, res_type=np.int16):
-        local_max = np.max(np.abs(data))
-        if local_max == 0:
-            return data
+        # Each block (row) is normalized on its own
+        local_max = np.max(np.abs(data), axis=-1, keepdims=True)
+
+        # Silent blocks stay silent
+        local_max[local_max == 0] = 1
 
         # Normalize the data
-        normalized_data = data / np.max(np.abs(data))
+        normalized_data = data / local_max
 
         # Scale the data
         max_val = np.iinfo(res_type).max
@@ -159,3 +217,28 @@ class operation(ABC):
 
     def get_fft_index(self, frequency):
         return round(frequency * self.block_size / self.sample_rate)
+
+
+class spectral_operation(operation):
+    # The transform from and to the signal is the same for all spectral operations,
+    # so consecutive ones can share it
+    def blocks_func(self, data):
+        # Compute the Fourier transform
+        spectrum = rfft(data)
+
+        # Change the spectrum
+        spectrum = self.spectrum_func(spectrum)
+
+        # Inverse FFT
+        # We use np.real to discard the imaginary part which occurs due to numerical errors
+        adjusted_data = np.real(irfft(spectrum))
+
+        return self.quantize(adjusted_data)
+
+    @abstractmethod
+    def spectrum_func(self, spectrum):
+        pass
+
+    def quantize(self, data):
+        # Normalize and scale the transformed data to the range of 16-bit signed integers
+        return operation.normalize_and_scale(data)
@@ -1,44 +1,56 @@
-from operations.operation import operation
+from operations.operation import operation, spectral_operation
 
 import numpy as np
-from scipy.fft import rfft, irfft
-from scipy.stats.mstats import winsorize
+
+
+def winsorize(data, limits):
+    # Same cut-offs as scipy.stats.mstats.winsorize, but on every row at once
+    n = data.shape[-1]
+    if n == 0:
+        return data
+
+    inf_prec, sup_prec = limits
+    low_idx = int(inf_prec * n) if inf_prec else 0
+    up_idx = n - int(sup_prec * n) - 1 if sup_prec else n - 1
+
+    # Only the two order statistics are needed, not a full sort
+    bounds = np.partition(data, [low_idx, up_idx], axis=-1)
+
+    # Clip everything outside of them
+    return np.clip(data, bounds[..., low_idx:low_idx + 1], bounds[..., up_idx:up_idx + 1])
 
 
 class winsorize_signal(operation):
+    batchable = True
+
     def __init__(self, inf_prec=0, sup_prec=0.05, **kwargs):
         super().__init__(**kwargs)
 
         self.limits = [inf_prec, sup_prec]
 
     def blocks_func(self, data):
-        # Winsorize the data
-        winsorize(data, self.limits, inplace=True)
+        # Winsorize the data, each row of a batch on its own
+        return winsorize(data, self.limits)
 
-        return data
 
+class winsorize_spectrum(spectral_operation):
+    batchable = True
 
-class winsorize_spectrum(operation):
     def __init__(self, inf_prec=0, sup_prec=0.1, **kwargs):
         super().__init__(**kwargs)
 
         self.limits = [inf_prec, sup_prec]
 
-    def blocks_func(self, data):
-        # Compute the Fourier transform
-        spectrum = rfft(data)
-
+    def spectrum_func(self, spectrum):
         # Compute the magnitudes and phases of the spectrum
         magnitudes = np.abs(spectrum)
         phases = np.angle(spectrum)
 
-        # Winsorize the magnitudes
-        winsorize(magnitudes, self.limits, inplace=True)
+        # Winsorize the magnitudes, each row of a batch on its own
+        magnitudes = winsorize(magnitudes, self.limits)
 
         # Retain original phase
-        winsorized_spectrum = np.multiply(magnitudes, np.exp(1j*phases))
-
-        # Inverse FFT
-        adjusted_data = np.real(irfft(winsorized_spectrum))
+        return np.multiply(magnitudes, np.exp(1j*phases))
 
-        return adjusted_data.astype(np.int16)
+    def quantize(self, data):
+        return data.astype(np.int16)
@@ -0,0 +1,484 @@
+from collections import deque
+from contextlib import ExitStack
+from functools import partial
+
+from os import cpu_count, makedirs, remove
+from os.path import exists, join
+
+from multiprocessing import Pool
+
+import numpy as np
+from scipy.fft import rfft, irfft
+
+from operations.operation import operation, spectral_operation, BATCH_SIZE_SAMPLES, BUFFER_SIZE_BYTES
+from utils.cache import file_key, operation_key
+from utils.lazy import batch_blocks, rechunk_blocks
+from utils.products import list_products, open_product, open_writer, product_name
+from utils.writer import merge_stats
+
+# Approximate number of samples sent to a worker in a single task
+CHUNK_SAMPLES = 1024 * 1024
+
+# Operations known by a worker, indexed by their position in the chain
+registry = []
+
+
+def register_operations(operations):
+    # Workers receive the operations only once, when they start
+    registry.clear()
+    registry.extend(operations)
+
+
+def apply_tuple(op_id, args):
+    return registry[op_id].blocks_func(*args)
+
+
+def fuses_spectrum(previous, stage):
+    # Opted in spectral operations hand their spectrum over, without rounding to 16 bits
+    return (
+        isinstance(previous, spectral_operation)
+        and isinstance(stage, spectral_operation)
+        and previous.fuse_spectral
+        and previous.block_size == stage.block_size
+    )
+
+
+def spectral_runs(stages):
+    runs = []
+
+    # Consecutive spectral operations stay in the frequency domain together
+    for stage in stages:
+        if len(runs) > 0 and fuses_spectrum(runs[-1][-1], stage):
+            runs[-1].append(stage)
+        else:
+            runs.append([stage])
+
+    return runs
+
+
+def apply_spectral(run, data, tapped, taps):
+    # Compute the Fourier transform only once for the whole run
+    spectrum = rfft(data)
+
+    for stage in run[:-1]:
+        spectrum = stage.spectrum_func(spectrum)
+
+        # The product of a stage inside the run, as if it had run on its own
+        if stage in tapped:
+            taps.append(stage.quantize(np.real(irfft(spectrum))))
+
+    spectrum = run[-1].spectrum_func(spectrum)
+
+    # Go back to the signal and quantize only at the end of the run
+    return run[-1].quantize(np.real(irfft(spectrum)))
+
+
+def apply_stages(stage_ids, batched, tap_ids, blocks):
+    runs = spectral_runs([registry[i] for i in stage_ids])
+    tapped = [registry[i] for i in tap_ids]
+    results = []
+
+    for block in blocks:
+        # Products of the stages before the last one, in order
+        taps = []
+
+        # Push the block through every fused stage, without leaving the worker
+        for run in runs:
+            if len(run) > 1:
+                block = apply_spectral(run, block, tapped, taps)
+            else:
+                block = run[0].blocks_func(block)
+
+        # Unstack the rows of a batch back into a stream of samples, some
+        # operations send more than the samples, already flat
+        if batched and isinstance(block, np.ndarray):
+            block = block.reshape(-1)
+            taps = [tap.reshape(-1) for tap in taps]
+
+        results.append((block, taps) if len(tap_ids) > 0 else block)
+
+    return results
+
+
+def ordered_map(pool, func, items, chunk_size, window):
+    # Chunks sent to the pool, in the order of the input
+    pending = deque()
+    chunk = []
+
+    for item in items:
+        chunk.append(item)
+
+        if len(chunk) < chunk_size:
+            continue
+
+        pending.append(pool.apply_async(func, (chunk,)))
+        chunk = []
+
+        # Do not read ahead more than the pool can process,
+        # and pass on the results that are already done
+        while len(pending) >= window or (len(pending) > 0 and pending[0].ready()):
+            yield from pending.popleft().get()
+
+    if len(chunk) > 0:
+        pending.append(pool.apply_async(func, (chunk,)))
+
+    while len(pending) > 0:
+        yield from pending.popleft().get()
+
+
+def write_blocks(writer, blocks, write_stats=None, name=None):
+    for block in blocks:
+        writer.write(block)
+
+        # Pass the block along to the next stage
+        yield block
+
+    # The product is complete
+    writer.close()
+    merge_stats(write_stats, name, writer.stats())
+
+
+def write_taps(taps, results, write_stats=None):
+    """
+    Writes the products of the stages inside a group, given as (writer, monitors,
+    name) in the order of the stages, and passes on the output of the group.
+    """
+    for block, tap_blocks in results:
+        for (writer, monitors, _), tap in zip(taps, tap_blocks):
+            writer.write(tap)
+
+            for monitor in monitors:
+                monitor.update(tap)
+
+        yield block
+
+    # The products are complete
+    for writer, monitors, name in taps:
+        writer.close()
+        merge_stats(write_stats, name, writer.stats())
+
+        for monitor in monitors:
+            monitor.close()
+
+
+def monitor_blocks(monitors, blocks):
+    for block in blocks:
+        for monitor in monitors:
+            monitor.update(block)
+
+        yield block
+
+    # The product is complete
+    for monitor in monitors:
+        monitor.close()
+
+
+class pipeline:
+    def __init__(self, operations, materialize_intermediate=False, batch_size=None,
+                 monitors=None, cache=None):
+        self.operations = operations
+        self.materialize_intermediate = materialize_intermediate
+
+        # Products of earlier runs, every product goes through it when set
+        self.cache = cache
+
+        # Number of blocks processed at once by batchable operations
+        self.batch_size = batch_size
+
+        # Gives the objects that look at every evaluated product, as (operation, file) -> list
+        self.monitors = monitors
+
+        # Time spent writing every product directory, and waiting for the disk
+        self.write_stats = {}
+
+        self.nr_workers = cpu_count()
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get_pool(self):
+        # The pool lives as long as the pipeline, shared by all operations and files
+        if self.pool is None:
+            self.pool = Pool(
+                self.nr_workers,
+                initializer=register_operations,
+                initargs=(self.operations,),
+            )
+
+        return self.pool
+
+    def close(self):
+        if self.pool is None:
+            return
+
+        self.pool.terminate()
+        self.pool.join()
+        self.pool = None
+
+    def evaluated(self):
+        # Products written only for the cache are not evaluated
+        if self.materialize_intermediate:
+            return self.operations
+
+        return self.operations[-1:]
+
+    def product_monitors(self, op, wav):
+        if self.monitors is None or op not in self.evaluated():
+            return []
+
+        return self.monitors(op, wav)
+
+    def materialized(self):
+        # Only the final product is written, unless intermediate products are evaluated
+        # or cached for the next runs
+        if self.materialize_intermediate or self.cache is not None:
+            return self.operations
+
+        return self.operations[-1:]
+
+    def can_fuse(self, previous, op):
+        # The result of the chain must not depend on which products are written,
+        # the workers also return the products inside a spectral run
+        if fuses_spectrum(previous, op):
+            return True
+
+        # Every intermediate product has to be written on its own
+        if len(self.materialized()) > 1:
+            return False
+
+        # The state carried between blocks lives in the main process
+        if previous.carries_state:
+            return False
+
+        # The blocks of the next operation must line up with the previous ones
+        return previous.preserves_length and previous.block_size == op.block_size
+
+    def stage_groups(self, operations):
+        groups = []
+
+        # Consecutive operations with matching blocks run as a single task
+        for op in operations:
+            if len(groups) > 0 and self.can_fuse(groups[-1][-1], op):
+                groups[-1].append(op)
+            else:
+                groups.append([op])
+
+        return groups
+
+    def get_batch_size(self, block_size):
+        if self.batch_size is not None:
+            return self.batch_size
+
+        return max(1, BATCH_SIZE_SAMPLES // block_size)
+
+    def execute(self):
+        # Operations with multiple inputs combine whole files, run them one by one
+        if any(op.nr_inputs != 1 for op in self.operations):
+            for i, op in enumerate(self.operations):
+                monitors = self.monitors if op in self.evaluated() else None
+                op.execute(self.get_pool(), partial(apply_tuple, i), self.batch_size, monitors,
+                           self.write_stats)
+            return
+
+        first = self.operations[0]
+
+        # Get all the products in the directory, sorted
+        wavs = list_products(first.audio_dir)
+
+        # If wavs is empty
+        if len(wavs) == 0:
+            # Exit early
+            return
+
+        # Create the product directories
+        for op in self.materialized():
+            makedirs(op.product_dir, exist_ok=True)
+
+        # Every file goes through the same pool
+        for wav in wavs:
+            self.execute_file(wav)
+
+    def cached_prefix(self, file):
+        # Key of the product of every operation, each one depends on all the previous
+        keys = []
+        key = file_key(file)
+
+        for op in self.operations:
+            key = operation_key(key, op)
+            keys.append(key)
+
+        # Longest chain of operations whose products are all cached
+        nr_cached = 0
+        while nr_cached < len(keys) and self.cache.contains(keys[nr_cached]):
+            nr_cached += 1
+
+        # A spectral run cannot start again from a rounded product, it is computed whole
+        while (
+            0 < nr_cached < len(keys)
+            and fuses_spectrum(self.operations[nr_cached - 1], self.operations[nr_cached])
+        ):
+            nr_cached -= 1
+
+        return keys, nr_cached
+
+    def restore_file(self, wav, keys, nr_cached):
+        for op, key in zip(self.operations[:nr_cached], keys):
+            product_file = join(op.product_dir, product_name(wav, op.product_format))
+            self.cache.restore(key, product_file)
+
+            # Evaluate the product as if it had just been written
+            monitors = self.product_monitors(op, wav)
+            if len(monitors) > 0:
+                blocks = open_product(product_file, CHUNK_SAMPLES)
+                for _ in monitor_blocks(monitors, blocks):
+                    pass
+
+    def execute_file(self, wav):
+        first = self.operations[0]
+        file = join(first.audio_dir, wav)
+
+        sample_rate, nframes, nchannels, sampwidth = operation.check_files([file])
+
+        # Samples without a known rate keep the one of the operation
+        if sample_rate is None:
+            sample_rate = first.sample_rate
+
+        # Block size edge case
+        if first.block_size is None or first.block_size > nframes:
+            first.block_size = nframes
+
+        operations = self.operations
+
+        # Skip the operations whose products are already known
+        if self.cache is not None:
+            keys, nr_cached = self.cached_prefix(file)
+            self.restore_file(wav, keys, nr_cached)
+
+            operations = self.operations[nr_cached:]
+
+            if len(operations) == 0:
+                return
+
+            # Start from the last known product
+            if nr_cached > 0:
+                last = self.operations[nr_cached - 1]
+                file = join(last.product_dir, product_name(wav, last.product_format))
+
+        # Evaluate blocks as needed
+        blocks = iter(open_product(file, first.block_size))
+
+        self.execute_blocks(wav, operations, blocks, sample_rate, nchannels, sampwidth)
+
+        # Keep the new products for the next runs
+        if self.cache is not None:
+            for op, key in zip(self.operations[nr_cached:], keys[nr_cached:]):
+                self.cache.store(key, join(op.product_dir, product_name(wav, op.product_format)))
+
+    def execute_stream(self, name, blocks, sample_rate, block_size):
+        """
+        Runs the operations on mono 16-bit blocks as they arrive, and writes
+        the products to name in the product directories.
+        """
+        if any(op.nr_inputs != 1 for op in self.operations):
+            raise Exception("Operations with multiple inputs cannot be streamed")
+
+        # A stream has no end, whole-stream blocks would never be complete
+        for op in self.operations:
+            if op.block_size is None:
+                op.block_size = block_size
+
+        # Create the product directories
+        for op in self.materialized():
+            makedirs(op.product_dir, exist_ok=True)
+
+        self.execute_blocks(name, self.operations, blocks, sample_rate, 1, 2, streaming=True)
+
+    def execute_blocks(self, wav, operations, blocks, sample_rate, nchannels, sampwidth,
+                       streaming=False):
+        materialized = self.materialized()
+
+        with ExitStack() as stack:
+            # Chain the stages lazily, the data never leaves memory in between
+            for group in self.stage_groups(operations):
+                block_size = group[0].block_size
+                stage_ids = [self.operations.index(op) for op in group]
+
+                # Stack the blocks of operations that work on whole batches
+                batched = (
+                    bool(block_size)
+                    and nchannels == 1
+                    and all(op.batchable for op in group)
+                )
+
+                if streaming:
+                    # Every block goes on as soon as it is complete
+                    blocks = rechunk_blocks(blocks, block_size)
+                    batched = False
+                    chunk_size = 1
+                elif batched:
+                    # Each batch is a single task
+                    blocks = batch_blocks(blocks, block_size, self.get_batch_size(block_size))
+                    chunk_size = 1
+                else:
+                    # Cut the stream in the blocks expected by this group
+                    blocks = rechunk_blocks(blocks, block_size)
+
+                    # Send a few blocks at once to the workers
+                    chunk_size = max(1, CHUNK_SAMPLES // block_size) if block_size else 1
+
+                # Products of the operations inside the group, only spectral runs keep them
+                tapped = [op for op in group[:-1] if op in materialized]
+                tap_ids = [self.operations.index(op) for op in tapped]
+
+                # Groups that only look at the blocks run in the main process
+                if any(op.uses_workers for op in group):
+                    blocks = ordered_map(self.get_pool(),
+                                         partial(apply_stages, stage_ids, batched, tap_ids),
+                                         blocks, chunk_size, 2 * self.nr_workers)
+
+                if len(tapped) > 0:
+                    taps = [
+                        (
+                            self.open_writer(stack, op, wav, sample_rate, nchannels, sampwidth,
+                                             streaming),
+                            self.product_monitors(op, wav),
+                            op.product_dir,
+                        )
+                        for op in tapped
+                    ]
+                    blocks = write_taps(taps, blocks, self.write_stats)
+
+                # Put the results of the workers back together
+                blocks = group[-1].join_blocks(blocks)
+
+                if group[-1] not in materialized:
+                    continue
+
+                writer = self.open_writer(stack, group[-1], wav, sample_rate, nchannels, sampwidth,
+                                          streaming)
+                blocks = write_blocks(writer, blocks, self.write_stats, group[-1].product_dir)
+
+                # Evaluate the product while it is written
+                monitors = self.product_monitors(group[-1], wav)
+                if len(monitors) > 0:
+                    blocks = monitor_blocks(monitors, blocks)
+
+            # Pull the data through the whole chain
+            for _ in blocks:
+                pass
+
+    def open_writer(self, stack, op, wav, sample_rate, nchannels, sampwidth, streaming):
+        # The product may be a link to a cached one, which must not change
+        product_file = join(op.product_dir, product_name(wav, op.product_format))
+        if exists(product_file):
+            remove(product_file)
+
+        # Open the product for writing, streamed products are written as they grow
+        return stack.enter_context(open_writer(
+            product_file, sample_rate, nchannels, sampwidth,
+            0 if streaming else BUFFER_SIZE_BYTES,
+        ))
@@ -1,23 +1,24 @@
-from operations.operation import operation
+from operations.operation import operation, spectral_operation
 from abc import abstractmethod
 
 import numpy as np
 from scipy.stats import rankdata, mode
-from scipy.fft import rfft, irfft
 
 
 class uniformize_signal(operation):
+    batchable = True
+
     def __init__(self, method='ordinal', **kwargs):
         super().__init__(**kwargs)
         self.method = method
 
     def blocks_func(self, data):
         # Normalize the data to the range of int16
-        data = data / np.max(np.abs(data))
+        data = data / np.max(np.abs(data), axis=-1, keepdims=True)
 
         # Apply the quantile transformation
-        ranked_data = rankdata(data, method=self.method)
-        uniform_data = (ranked_data - 1) / (len(ranked_data) - 1)
+        ranked_data = rankdata(data, method=self.method, axis=-1)
+        uniform_data = (ranked_data - 1) / (ranked_data.shape[-1] - 1)
 
         # Scale the data back to int16
         max_val = np.iinfo(np.int16).max
@@ -27,11 +28,10 @@ class uniformize_signal(operation):
         return uniform_data
 
 
-class uniformize_spectrum(operation):
-    def blocks_func(self, data):
-        # Compute the Fourier transform
-        spectrum = rfft(data)
+class uniformize_spectrum(spectral_operation):
+    batchable = True
 
+    def spectrum_func(self, spectrum):
         # Compute the magnitudes of the spectrum
         magnitudes = np.abs(spectrum)
 
@@ -42,13 +42,10 @@ class uniformize_spectrum(operation):
         magnitudes[magnitudes == 0] = 1
 
         # Compute the whitened spectrum
-        whitened_spectrum = (spectrum / magnitudes) * yardstick
-
-        # Return the inverse Fourier transform of the whitened spectrum
-        # We use np.real to discard the imaginary part which occurs due to numerical errors
-        whitened_data = np.real(irfft(whitened_spectrum))
+        return (spectrum / magnitudes) * yardstick
 
-        return whitened_data.astype(np.int16)
+    def quantize(self, data):
+        return data.astype(np.int16)
 
     @abstractmethod
     def get_yardstick(self, magnitudes):
@@ -57,13 +54,13 @@ class uniformize_spectrum(operation):
 
 class uniformize_spectrum_mean(uniformize_spectrum):
     def get_yardstick(self, magnitudes):
-        return np.mean(magnitudes)
+        return np.mean(magnitudes, axis=-1, keepdims=True)
 
 
 class uniformize_spectrum_median(uniformize_spectrum):
     def get_yardstick(self, magnitudes):
-        return np.median(magnitudes)
+        return np.median(magnitudes, axis=-1, keepdims=True)
 
 class uniformize_spectrum_maximum(uniformize_spectrum):
     def get_yardstick(self, magnitudes):
-        return np.max(magnitudes)
+        return np.max(magnitudes, axis=-1, keepdims=True)
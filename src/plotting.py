@@ -0,0 +1,350 @@
+# Wav files
+from utils.products import open_product
+
+# Maths
+import numpy as np
+from matplotlib.mlab import window_hanning
+from scipy.fft import rfft, rfftfreq
+
+# Plots and images, rendered off screen so that workers can draw them
+import matplotlib
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import seaborn
+
+from PIL import Image
+
+# List of colors to use for plots.
+color_list = ['skyblue', 'orange', 'green', 'red',
+              'purple', 'brown', 'pink', 'gray', 'olive', 'cyan']
+
+# Use seaborn styles for pretty plots
+seaborn.set_theme(style="darkgrid")
+
+# Waves longer than this many points are drawn as a min/max envelope,
+# about one pair per pixel of a 12 inch wide plot at 300 dpi
+ENVELOPE_POINTS = 12 * 300
+
+# Bins of the envelope computed from a single block read
+ENVELOPE_BLOCK_BINS = 256
+
+
+class capture:
+    """
+    The samples of a product, decoded once and shared by all the plots.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+        # The samples are mapped, not copied
+        blocks = open_product(file_path)
+        self.sample_rate = blocks.frame_rate
+        self.num_frames = blocks.num_frames
+        self.data = blocks.samples
+
+        self.windowed_spectrum = None
+
+    def get_windowed_spectrum(self):
+        # Magnitudes and phases come from the same transform
+        if self.windowed_spectrum is None:
+            # Apply a Hanning window to the data and take the Fourier transform
+            self.windowed_spectrum = rfft(window_hanning(self.data))
+
+        return self.windowed_spectrum
+
+
+def as_capture(audio_file):
+    # Plots accept either a path or an already decoded file
+    if isinstance(audio_file, capture):
+        return audio_file
+
+    return capture(audio_file)
+
+
+def wave_envelope(audio, nr_points=ENVELOPE_POINTS):
+    # Samples summarized by every point of the envelope
+    bin_size = -(-audio.num_frames // nr_points)
+
+    lows = []
+    highs = []
+
+    # Read a few whole bins at a time
+    for block in open_product(audio.file_path, bin_size * ENVELOPE_BLOCK_BINS):
+        # Scale the samples to [-1, 1) and mix the channels down
+        y = block / float(np.iinfo(block.dtype).max + 1)
+        if y.ndim > 1:
+            y = y.mean(axis=1)
+
+        # The last bin of the capture may be shorter
+        nr_bins = -(-len(y) // bin_size)
+        starts = np.arange(nr_bins) * bin_size
+
+        lows.append(np.minimum.reduceat(y, starts))
+        highs.append(np.maximum.reduceat(y, starts))
+
+    # Time at the start of every bin, and the end of the last one
+    t = np.arange(sum(map(len, lows)) + 1) * bin_size / audio.sample_rate
+    t[-1] = audio.num_frames / audio.sample_rate
+
+    # The last bin is repeated so that it spans until the end
+    lows = np.concatenate(lows)
+    highs = np.concatenate(highs)
+
+    return t, np.append(lows, lows[-1]), np.append(highs, highs[-1])
+
+
+def plot_waves(audio_files, output, title=None, labels=None):
+    # Create a new figure with a decently large size (in inches)
+    plt.figure(figsize=(12, 6))
+
+    nr_audios = len(audio_files)
+    nr_colors = len(color_list)
+
+    # Check if more files than colors available
+    assert nr_audios <= nr_colors, f'Please add more colors. ' + \
+        f'Number of files({nr_audios}) exceeds number of colors({nr_colors}).'
+
+    # Assert that labels and audio_files have the same length
+    assert labels is None or nr_audios == len(labels), \
+        "The number of labels must be the same as the number of audio files."
+
+    audios = [as_capture(f) for f in audio_files]
+
+    # Plot each file
+    for i, audio in enumerate(audios):
+        # Get the label
+        if labels is not None:
+            legend_label = labels[i]
+        else:
+            legend_label = f'Wave of {audio.file_path}'
+
+        # Long captures have more samples than pixels, draw only their extremes
+        if audio.num_frames > 2 * ENVELOPE_POINTS:
+            t, lows, highs = wave_envelope(audio)
+
+            plt.fill_between(t, lows, highs, step='post', color=color_list[i],
+                             linewidth=0.5, edgecolor=color_list[i], label=legend_label)
+            continue
+
+        # Scale the samples to [-1, 1) and mix the channels down
+        y = audio.data / float(np.iinfo(audio.data.dtype).max + 1)
+        if y.ndim > 1:
+            y = y.mean(axis=1)
+
+        # Generate a time axis
+        t = np.arange(len(y)) / audio.sample_rate
+
+        # Plot the wave
+        plt.plot(t, y, color=color_list[i], label=legend_label)
+
+    if title is None:
+        title = 'Wave of ' + ' '.join(audio.file_path for audio in audios)
+
+    # Plot the wave
+    plt.title(title, fontsize=16)
+    plt.xlabel("Time (s)", fontsize=14)
+    plt.ylabel("Amplitude", fontsize=14)
+    plt.legend(loc='upper right')
+    plt.grid(True)
+
+    # Save the figure as a high-res PNG
+    plt.savefig(output, dpi=300, format='png')
+    # Close the figure
+    plt.close()
+
+
+def plot_distribution(audio_file, output, description=None):
+    audio = as_capture(audio_file)
+
+    # All the samples, channels interleaved
+    data = audio.data.reshape(-1)
+
+    if description is None:
+        description = 'Data distribution of ' + audio.file_path
+
+    # Create a new figure with a decently large size (in inches)
+    plt.figure(figsize=(10, 6))
+
+    # Plot a histogram of the data values with a higher number of bins and a subtle color
+    ax = seaborn.histplot(data, bins=100, color='skyblue',
+                          edgecolor='black', kde=True)
+    ax.lines[0].set_color('xkcd:pumpkin orange')
+    ax.lines[0].set_linewidth(2)
+
+    # Label the axes and provide a title
+    plt.title(description, fontsize=16)
+    plt.xlabel("Amplitude", fontsize=14)
+    plt.ylabel("Density", fontsize=14)
+    plt.grid(True)
+
+    # Use tight layout to optimize space
+    plt.tight_layout()
+
+    # Save the figure as a high-res PNG
+    plt.savefig(output, dpi=300, format='png')
+
+    # Close the figure
+    plt.close()
+
+
+def plot_spectrogram(audio_file, output, title=None):
+    audio = as_capture(audio_file)
+
+    # All the samples, channels interleaved
+    raw_signal = audio.data.reshape(-1)
+
+    # Create a new figure with a decently large size (in inches)
+    plt.figure(figsize=(10, 6))
+
+    # Set up the plot in a printer-friendly way
+    plt.rcParams['font.size'] = 14
+    plt.rcParams['axes.labelsize'] = 14
+    plt.rcParams['axes.titlesize'] = 16
+    plt.rcParams['xtick.labelsize'] = 12
+    plt.rcParams['ytick.labelsize'] = 12
+    plt.rcParams['figure.titlesize'] = 16
+
+    plt.specgram(raw_signal, NFFT=1024, Fs=audio.sample_rate,
+                 window=window_hanning, scale='dB', cmap='viridis')
+
+    if title is None:
+        title = 'Spectrogram of ' + audio.file_path + ' file'
+
+    # Label the axes and provide a title
+    plt.title(title)
+    plt.xlabel('Time (sec)')
+    plt.ylabel('Frequency (Hz)')
+
+    plt.colorbar(label='Amplitude (dB)', orientation='vertical')
+
+    # Use tight layout to optimize space
+    plt.tight_layout()
+
+    # Save the figure as a high-res PNG
+    plt.savefig(output, dpi=300, format='png')
+
+    # Close the figure
+    plt.close()
+
+
+def plot_spectrum(audio_file, output, title=None):
+    audio = as_capture(audio_file)
+
+    # Same magnitudes as plt.magnitude_spectrum, from the shared transform
+    magnitudes = np.abs(audio.get_windowed_spectrum()) / np.hanning(len(audio.data)).sum()
+    frequencies = rfftfreq(len(audio.data), 1 / audio.sample_rate)
+
+    # Create a new figure with a decently large size (in inches)
+    plt.figure(figsize=(10, 6))
+
+    # Plot the magnitude spectrum
+    plt.plot(frequencies, magnitudes, color='xkcd:azure')
+
+    if title is None:
+        title = 'Spectrum of ' + audio.file_path + ' file'
+
+    # Label the axes and provide a title
+    plt.title(title, fontsize=16)
+    plt.xlabel('Frequency (Hz)', fontsize=14)
+    plt.ylabel('Magnitude', fontsize=14)
+    plt.grid(True)
+
+    # Use tight layout to optimize space
+    plt.tight_layout()
+
+    # Save the figure as a high-res PNG
+    plt.savefig(output, dpi=300, format='png')
+    # Close the figure
+    plt.close()
+
+
+def plot_magnitude_distribution(audio_file, output, title=None):
+    audio = as_capture(audio_file)
+
+    # Take the Fourier transform of the windowed data
+    magnitudes = np.abs(audio.get_windowed_spectrum())
+
+    # Create a new figure with a decently large size (in inches)
+    plt.figure(figsize=(10, 6))
+
+    # Plot the distribution of magnitudes
+    ax = seaborn.histplot(magnitudes, bins=100, color='skyblue',
+                          kde=True)
+    ax.lines[0].set_color('xkcd:pumpkin orange')
+    ax.lines[0].set_linewidth(2)
+
+    if title is None:
+        title = 'Distribution of Magnitudes in ' + audio.file_path + ' file'
+
+    # Label the axes and provide a title
+    plt.title(title, fontsize=16)
+    plt.xlabel('Magnitude', fontsize=14)
+    plt.ylabel('Density', fontsize=14)
+    plt.grid(True)
+
+    # Use tight layout to optimize space
+    plt.tight_layout()
+
+    # Save the figure as a high-res PNG
+    plt.savefig(output, dpi=300, format='png')
+    # Close the figure
+    plt.close()
+
+
+def plot_phase_distribution(audio_file, output, title=None):
+    audio = as_capture(audio_file)
+
+    # Take the Fourier transform of the windowed data
+    phases = np.angle(audio.get_windowed_spectrum())
+
+    # Create a new figure with a decently large size (in inches)
+    plt.figure(figsize=(10, 6))
+
+    # Plot the distribution of phases
+    ax = seaborn.histplot(phases, bins=100, color='skyblue',
+                          edgecolor='black', kde=True)
+    ax.lines[0].set_color('xkcd:pumpkin orange')
+    ax.lines[0].set_linewidth(2)
+
+    if title is None:
+        title = 'Distribution of Phases in ' + audio.file_path + ' file'
+
+    # Label the axes and provide a title
+    plt.title(title, fontsize=16)
+    plt.xlabel('Phase (radians)', fontsize=14)
+    plt.ylabel('Density', fontsize=14)
+    plt.grid(True)
+
+    # Use tight layout to optimize space
+    plt.tight_layout()
+
+    # Save the figure as a high-res PNG
+    plt.savefig(output, dpi=300, format='png')
+    # Close the figure
+    plt.close()
+
+
+def audio_to_bitmap(audio_file, output):
+    # Read the audio file
+    data = as_capture(audio_file).data
+
+    # Normalize to 0-255
+    data = ((data / np.max(np.abs(data))) * 255).astype(np.uint8)
+
+    # Reshape the data into a square format
+    length = data.shape[0]
+    dim = int(np.sqrt(length)) + 1
+
+    # Pad the data if it cannot be reshaped into a perfect square
+    data = np.pad(data, (0, dim*dim - length), 'constant', constant_values=255)
+
+    # Reshape the data into a square
+    image_data = data.reshape((dim, dim))
+
+    # Convert the array into an image
+    img = Image.fromarray(image_data)
+
+    # Save the image
+    img.save(output)
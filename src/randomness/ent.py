@@ -0,0 +1,147 @@
+import numpy as np
+from scipy.stats import chi2
+
+# Bytes per Monte Carlo point, half for each coordinate
+MONTE_BYTES = 6
+
+# Radius of the circle, squared, for 24-bit coordinates
+IN_CIRCLE = (256 ** (MONTE_BYTES // 2) - 1) ** 2
+
+
+class ent_accumulator:
+    """
+    Computes the same statistics as ent, one block at a time.
+    """
+
+    def __init__(self):
+        # Occurrences of every byte value
+        self.counts = np.zeros(256, dtype=np.int64)
+
+        # Monte Carlo points, and the bytes that did not make a whole point yet
+        self.monte_pending = np.array([], dtype=np.uint8)
+        self.monte_tries = 0
+        self.monte_inside = 0
+
+        # Sum of the products of consecutive bytes, for the serial correlation
+        self.first = None
+        self.last = None
+        self.serial_sum = 0
+
+    def update(self, data):
+        data = np.ascontiguousarray(data).reshape(-1).view(np.uint8)
+
+        if len(data) == 0:
+            return
+
+        self.counts += np.bincount(data, minlength=256)
+
+        self.update_monte_carlo(data)
+        self.update_serial(data)
+
+    def update_monte_carlo(self, data):
+        if len(self.monte_pending) > 0:
+            data = np.concatenate((self.monte_pending, data))
+
+        # Keep the bytes that do not fill a point for the next block
+        usable = (len(data) // MONTE_BYTES) * MONTE_BYTES
+        self.monte_pending = data[usable:].copy()
+
+        # Both coordinates are big endian 24-bit integers
+        points = data[:usable].reshape(-1, 2, 3).astype(np.int64)
+        coordinates = (points[..., 0] << 16) | (points[..., 1] << 8) | points[..., 2]
+
+        radius = np.sum(coordinates ** 2, axis=1)
+
+        self.monte_tries += len(radius)
+        self.monte_inside += int(np.count_nonzero(radius <= IN_CIRCLE))
+
+    def update_serial(self, data):
+        values = data.astype(np.int64)
+
+        if self.first is None:
+            self.first = int(values[0])
+        else:
+            # Link the block to the previous one
+            self.serial_sum += self.last * int(values[0])
+
+        self.serial_sum += int(np.dot(values[:-1], values[1:]))
+        self.last = int(values[-1])
+
+    def results(self):
+        total = int(self.counts.sum())
+        values = np.arange(256)
+
+        # Entropy in bits per byte
+        probabilities = self.counts[self.counts > 0] / total
+        entropy = float(-np.sum(probabilities * np.log2(probabilities)))
+
+        # Chi-square against a uniform distribution of bytes
+        expected = total / 256
+        chi_square = float(np.sum((self.counts - expected) ** 2) / expected)
+
+        mean = float(np.dot(values, self.counts) / total)
+        monte_pi = 4 * self.monte_inside / self.monte_tries if self.monte_tries > 0 else 0.0
+
+        # The sequence is closed as a circle, like ent does
+        sum_xy = self.serial_sum + self.last * self.first
+        sum_x = int(np.dot(values, self.counts))
+        sum_x2 = int(np.dot(values ** 2, self.counts))
+
+        denominator = total * sum_x2 - sum_x ** 2
+        if denominator == 0:
+            serial_correlation = None
+        else:
+            serial_correlation = (total * sum_xy - sum_x ** 2) / denominator
+
+        return {
+            "bytes": total,
+            "entropy": entropy,
+            "chi_square": chi_square,
+            "chi_square_probability": float(chi2.sf(chi_square, 255)),
+            "mean": mean,
+            "monte_carlo_pi": monte_pi,
+            "serial_correlation": serial_correlation,
+        }
+
+    def report(self):
+        r = self.results()
+
+        if r["bytes"] == 0:
+            return "No data.\n"
+
+        compression = int(100 * (8 - r["entropy"]) / 8)
+        probability = r["chi_square_probability"]
+        pi_error = 100 * abs(np.pi - r["monte_carlo_pi"]) / np.pi
+
+        # Same layout as the output of ent
+        lines = [
+            f"Entropy = {r['entropy']:.6f} bits per byte.",
+            "",
+            "Optimum compression would reduce the size",
+            f"of this {r['bytes']} byte file by {compression} percent.",
+            "",
+            f"Chi square distribution for {r['bytes']} samples is {r['chi_square']:.2f}, and randomly",
+        ]
+
+        if probability < 0.0001:
+            lines.append("would exceed this value less than 0.01 percent of the times.")
+        elif probability > 0.9999:
+            lines.append("would exceed this value more than than 99.99 percent of the times.")
+        else:
+            lines.append(f"would exceed this value {probability * 100:.2f} percent of the times.")
+
+        lines += [
+            "",
+            f"Arithmetic mean value of data bytes is {r['mean']:.4f} (127.5 = random).",
+            f"Monte Carlo value for Pi is {r['monte_carlo_pi']:.9f} (error {pi_error:.2f} percent).",
+        ]
+
+        if r["serial_correlation"] is None:
+            lines.append("Serial correlation coefficient is undefined (all values equal!).")
+        else:
+            lines.append(
+                f"Serial correlation coefficient is {r['serial_correlation']:.6f} "
+                + "(totally uncorrelated = 0.0)."
+            )
+
+        return "\n".join(lines) + "\n\n"
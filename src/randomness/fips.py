@@ -0,0 +1,179 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from os.path import getsize
+
+import numpy as np
+
+# FIPS 140-2 tests work on blocks of 20000 bits
+BLOCK_BYTES = 2500
+BLOCK_BITS = BLOCK_BYTES * 8
+
+# Like rngtest, the first 32 bits only seed the continuous run test
+SEED_BYTES = 4
+
+# Number of blocks evaluated by a worker at once
+SHARD_BLOCKS = 512
+
+# Acceptance intervals from the 2001-10-10 change notice, bounds excluded
+MONOBIT_INTERVAL = (9725, 10275)
+POKER_INTERVAL = (2.16, 46.17)
+RUNS_INTERVALS = np.array([
+    (2315, 2685),
+    (1114, 1386),
+    (527, 723),
+    (240, 384),
+    (103, 209),
+    (103, 209),
+])
+LONG_RUN = 26
+
+TESTS = ["monobit", "poker", "runs", "long_run", "continuous_run"]
+
+# One boolean per test, True if the block passed it
+RESULT_DTYPE = np.dtype([(test, np.bool_) for test in TESTS])
+
+POPCOUNT = np.array([bin(b).count("1") for b in range(256)], dtype=np.int32)
+
+
+def test_monobit(blocks):
+    ones = POPCOUNT[blocks].sum(axis=1)
+
+    return (MONOBIT_INTERVAL[0] < ones) & (ones < MONOBIT_INTERVAL[1])
+
+
+def test_poker(blocks):
+    nr_blocks = len(blocks)
+
+    # Both nibbles of every byte, tagged with the row they belong to
+    rows = np.repeat(np.arange(nr_blocks) * 16, 2 * BLOCK_BYTES)
+    nibbles = np.stack((blocks >> 4, blocks & 0xF), axis=-1).reshape(-1)
+
+    # Count the nibbles of all the blocks at once
+    counts = np.bincount(rows + nibbles, minlength=nr_blocks * 16).reshape(-1, 16)
+
+    x = 16 / 5000 * np.sum(counts.astype(np.int64) ** 2, axis=1) - 5000
+
+    return (POKER_INTERVAL[0] < x) & (x < POKER_INTERVAL[1])
+
+
+def count_runs(blocks):
+    """
+    Counts the runs of every block, of either bit and of lengths 1 to 6 or
+    more, along with the runs of LONG_RUN bits or more.
+    """
+    nr_blocks = len(blocks)
+
+    # Like rngtest, the bits of every byte are read from the least significant one
+    bits = np.unpackbits(blocks.reshape(-1), bitorder="little")
+
+    # A run starts wherever the bit changes or a block starts
+    starts = np.empty(bits.size, dtype=bool)
+    starts[0] = True
+    np.not_equal(bits[1:], bits[:-1], out=starts[1:])
+    starts[::BLOCK_BITS] = True
+
+    positions = np.flatnonzero(starts)
+    lengths = np.diff(positions, append=bits.size)
+    rows = positions // BLOCK_BITS
+    values = bits[positions]
+
+    # Runs of 6 or more are counted together
+    classes = np.minimum(lengths, 6) - 1
+    counts = np.bincount(
+        rows * 12 + values * 6 + classes, minlength=nr_blocks * 12
+    ).reshape(nr_blocks, 2, 6)
+
+    long_runs = np.bincount(rows[lengths >= LONG_RUN], minlength=nr_blocks)
+
+    return counts, long_runs
+
+
+def test_runs(blocks):
+    counts, long_runs = count_runs(blocks)
+
+    runs = np.all(
+        (RUNS_INTERVALS[:, 0] <= counts) & (counts <= RUNS_INTERVALS[:, 1]),
+        axis=(1, 2),
+    )
+
+    # A single run that is too long is enough to fail
+    return runs, long_runs == 0
+
+
+def test_continuous_run(blocks, previous):
+    # Compare every 32-bit word with the one before it
+    words = blocks.view(">u4")
+    previous_words = np.concatenate(([previous], words.reshape(-1)[:-1]))
+
+    return np.all(words != previous_words.reshape(words.shape), axis=1)
+
+
+def fips_test_blocks(blocks, previous):
+    results = np.empty(len(blocks), dtype=RESULT_DTYPE)
+
+    results["monobit"] = test_monobit(blocks)
+    results["poker"] = test_poker(blocks)
+    results["runs"], results["long_run"] = test_runs(blocks)
+    results["continuous_run"] = test_continuous_run(blocks, previous)
+
+    return results
+
+
+def fips_test_shard(file_path, offset, size, shard):
+    data = np.memmap(file_path, dtype=np.uint8, mode="r", offset=offset, shape=(size,))
+
+    # Blocks of the shard, and the word right before them
+    start = SEED_BYTES + shard * SHARD_BLOCKS * BLOCK_BYTES
+    end = min(start + SHARD_BLOCKS * BLOCK_BYTES, SEED_BYTES + nr_fips_blocks(size) * BLOCK_BYTES)
+
+    blocks = np.array(data[start:end]).reshape(-1, BLOCK_BYTES)
+    previous = data[start - SEED_BYTES:start].view(">u4")[0]
+
+    return fips_test_blocks(blocks, previous)
+
+
+def nr_fips_blocks(size):
+    return max(0, size - SEED_BYTES) // BLOCK_BYTES
+
+
+def fips_test_file(file_path, offset=0, size=None, max_workers=None):
+    """
+    Runs the FIPS 140-2 tests over the bytes of a file, in parallel.
+
+    Returns a structured array with the results of every block.
+    """
+    if size is None:
+        size = getsize(file_path) - offset
+
+    nr_blocks = nr_fips_blocks(size)
+    nr_shards = -(-nr_blocks // SHARD_BLOCKS)
+
+    shard_func = partial(fips_test_shard, file_path, offset, size)
+
+    # Small inputs are not worth the processes
+    if nr_shards <= 1:
+        shards = map(shard_func, range(nr_shards))
+        return np.concatenate([np.empty(0, dtype=RESULT_DTYPE), *shards])
+
+    with ProcessPoolExecutor(max_workers) as executor:
+        shards = executor.map(shard_func, range(nr_shards))
+        return np.concatenate(list(shards))
+
+
+def fips_summary(results, nr_bits):
+    # Same figures as rngtest
+    successes = np.all([results[test] for test in TESTS], axis=0)
+
+    lines = [
+        f"bits received from input: {nr_bits}",
+        f"FIPS 140-2 successes: {np.count_nonzero(successes)}",
+        f"FIPS 140-2 failures: {np.count_nonzero(~successes)}",
+        f"FIPS 140-2(2001-10-10) Monobit: {np.count_nonzero(~results['monobit'])}",
+        f"FIPS 140-2(2001-10-10) Poker: {np.count_nonzero(~results['poker'])}",
+        f"FIPS 140-2(2001-10-10) Runs: {np.count_nonzero(~results['runs'])}",
+        f"FIPS 140-2(2001-10-10) Long run: {np.count_nonzero(~results['long_run'])}",
+        f"FIPS 140-2(2001-10-10) Continuous run: {np.count_nonzero(~results['continuous_run'])}",
+    ]
+
+    return "".join(f"rngtest: {line}\n" for line in lines)
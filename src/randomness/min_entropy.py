@@ -0,0 +1,624 @@
+import numpy as np
+
+# Symbols used by the estimators, as recommended by SP 800-90B
+MAX_SYMBOLS = 1000000
+
+# Upper bound of the 99% confidence interval
+Z_ALPHA = 2.576
+
+# t-Tuple and LRS estimates only use tuples seen at least this many times
+TUPLE_CUTOFF = 35
+
+# Compression estimate parameters
+COMPRESSION_BITS = 6
+COMPRESSION_DICTIONARY = 1000
+
+# Predictor parameters
+MCW_WINDOWS = [63, 255, 1023, 4095]
+LAG_DEPTH = 128
+MMC_DEPTH = 16
+MMC_MAX_ENTRIES = 100000
+LZ78Y_DEPTH = 16
+LZ78Y_MAX_DICTIONARY = 65536
+
+# Predictions computed at once, bounds the memory used by the predictors
+PREDICTION_CHUNK = 4096
+
+# Iterations of the binary searches, more than enough for double precision
+SEARCH_STEPS = 64
+
+
+def upper_bound(p, n):
+    return min(1.0, p + Z_ALPHA * np.sqrt(p * (1 - p) / (n - 1)))
+
+
+def bisect(func, target, low, high, increasing):
+    # Find p in [low, high] such that func(p) == target
+    for _ in range(SEARCH_STEPS):
+        middle = (low + high) / 2
+
+        if (func(middle) < target) == increasing:
+            low = middle
+        else:
+            high = middle
+
+    return (low + high) / 2
+
+
+def most_common_value(symbols):
+    counts = np.bincount(symbols)
+    p = upper_bound(counts.max() / len(symbols), len(symbols))
+
+    return -np.log2(p)
+
+
+def collision(bits):
+    # Binary inputs collide after two or three bits
+    equal = (bits[1:] == bits[:-1]).tolist()
+    times = []
+
+    i = 0
+    while i + 2 < len(bits):
+        if equal[i]:
+            times.append(2)
+            i += 2
+        else:
+            times.append(3)
+            i += 3
+
+    times = np.array(times, dtype=np.float64)
+    mean = times.mean() - Z_ALPHA * times.std(ddof=1) / np.sqrt(len(times))
+
+    def expected_time(p):
+        q = 1 - p
+        z = 1 / q
+
+        # F(1/z) = Gamma(3, z) z^-3 e^z
+        f = 2 * (1 + z + z ** 2 / 2) / z ** 3
+        d = 1 / p - 1 / q
+
+        return p / q ** 2 * (1 + d / 2) * f - p / q * d / 2
+
+    # A fair source collides after 2.5 bits on average
+    if mean >= expected_time(0.5):
+        return 1.0
+
+    p = bisect(expected_time, mean, 0.5, 1 - 1e-12, increasing=False)
+
+    return -np.log2(p)
+
+
+def markov(bits):
+    n = len(bits)
+
+    p1 = np.count_nonzero(bits) / n
+    p0 = 1 - p1
+
+    # Transition counts between consecutive bits
+    transitions = np.bincount(2 * bits[:-1] + bits[1:], minlength=4).reshape(2, 2)
+    totals = transitions.sum(axis=1, keepdims=True)
+    t = np.divide(transitions, totals, out=np.zeros((2, 2)), where=totals > 0)
+
+    # Most likely sequences of 128 bits
+    with np.errstate(divide="ignore"):
+        log_t = np.log2(t)
+        log_p = np.log2([p0, p1])
+
+    candidates = [
+        log_p[0] + 127 * log_t[0, 0],
+        log_p[0] + 64 * log_t[0, 1] + 63 * log_t[1, 0],
+        log_p[0] + log_t[0, 1] + 126 * log_t[1, 1],
+        log_p[1] + log_t[1, 0] + 126 * log_t[0, 0],
+        log_p[1] + 64 * log_t[1, 0] + 63 * log_t[0, 1],
+        log_p[1] + 127 * log_t[1, 1],
+    ]
+
+    return min(-np.nanmax(candidates) / 128, 1.0)
+
+
+def compression(bits, b=COMPRESSION_BITS, d=COMPRESSION_DICTIONARY):
+    # Non-overlapping b-bit symbols
+    nr_symbols = len(bits) // b
+    symbols = np.packbits(
+        bits[:nr_symbols * b].reshape(nr_symbols, b), axis=1, bitorder="little"
+    )[:, 0]
+
+    v = nr_symbols - d
+    positions = np.arange(1, nr_symbols + 1)
+
+    # Last previous occurrence of every symbol, found by sorting
+    order = np.lexsort((positions, symbols))
+    previous = np.zeros(nr_symbols, dtype=np.int64)
+    same = symbols[order][1:] == symbols[order][:-1]
+    previous[order[1:][same]] = positions[order[:-1][same]]
+
+    # Distances of the symbols after the dictionary
+    tested = slice(d, nr_symbols)
+    distances = np.where(previous[tested] > 0, positions[tested] - previous[tested], positions[tested])
+    scores = np.log2(distances)
+
+    c = 0.5907
+    mean = scores.mean() - Z_ALPHA * c * scores.std(ddof=1) / np.sqrt(v)
+
+    # G(z), with the double sum rearranged so that it is linear in the length
+    u = np.arange(1, nr_symbols + 1, dtype=np.float64)
+    log_u = np.log2(u)
+    weights = nr_symbols - np.maximum(u, d)
+    last = u > d
+
+    def g(z):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            powers = np.power(1 - z, u - 1)
+
+        first = z ** 2 * np.sum((log_u * powers * weights)[:-1])
+        second = z * np.sum((log_u * powers)[last])
+
+        return (first + second) / v
+
+    def expected_score(p):
+        q = (1 - p) / (2 ** b - 1)
+        return g(p) + (2 ** b - 1) * g(q)
+
+    low = 2 ** -b
+
+    # More random than the model can tell
+    if mean >= expected_score(low):
+        return 1.0
+
+    p = bisect(expected_score, mean, low, 1.0, increasing=False)
+
+    return -np.log2(p) / b
+
+
+def suffix_ranks(symbols):
+    # Prefix doubling: ranks of the first 2^k symbols of every suffix, for every k
+    n = len(symbols)
+    ranks = [symbols.astype(np.int64)]
+    k = 1
+
+    while True:
+        rank = ranks[-1]
+        second = np.full(n, -1, dtype=np.int64)
+        second[:n - k] = rank[k:]
+
+        order = np.lexsort((second, rank))
+        changes = (rank[order][1:] != rank[order][:-1]) | (second[order][1:] != second[order][:-1])
+
+        new_rank = np.empty(n, dtype=np.int64)
+        new_rank[order] = np.concatenate(([0], np.cumsum(changes)))
+        ranks.append(new_rank)
+
+        # All suffixes are told apart
+        if new_rank.max() == n - 1:
+            return order, ranks
+
+        k *= 2
+
+
+def longest_common_prefixes(symbols):
+    n = len(symbols)
+    suffixes, ranks = suffix_ranks(symbols)
+
+    a = suffixes[:-1]
+    b = suffixes[1:]
+    lcp = np.zeros(n - 1, dtype=np.int64)
+
+    # Binary lifting over the ranks of every prefix length
+    for level in range(len(ranks) - 2, -1, -1):
+        length = 1 << level
+        valid = (a + lcp + length <= n) & (b + lcp + length <= n)
+
+        x = np.minimum(a + lcp, n - 1)
+        y = np.minimum(b + lcp, n - 1)
+        equal = valid & (ranks[level][x] == ranks[level][y])
+
+        lcp += equal * length
+
+    return lcp
+
+
+def tuple_groups(lcp):
+    # Groups of adjacent suffixes sharing at least t symbols, for t = 1, 2, ...
+    positions = np.arange(len(lcp))
+    t = 1
+
+    while len(positions) > 0:
+        positions = positions[lcp[positions] >= t]
+
+        # Split where two kept positions are not adjacent
+        breaks = np.flatnonzero(np.diff(positions) != 1) + 1
+        sizes = np.diff(np.concatenate(([0], breaks, [len(positions)]))) + 1
+
+        yield t, sizes[sizes > 1]
+        t += 1
+
+
+def t_tuple_and_lrs(symbols):
+    n = len(symbols)
+    lcp = longest_common_prefixes(symbols)
+
+    tuple_p = []
+    lrs_p = []
+
+    for t, sizes in tuple_groups(lcp):
+        q = sizes.max() if len(sizes) > 0 else 1
+        nr_tuples = n - t + 1
+
+        # t-Tuple: frequent tuples only
+        if q >= TUPLE_CUTOFF:
+            tuple_p.append((q / nr_tuples) ** (1 / t))
+
+        # LRS: tuples too rare for the t-Tuple estimate, but still repeated
+        elif len(sizes) > 0:
+            pairs = np.sum(sizes * (sizes - 1) / 2)
+            lrs_p.append((pairs / (nr_tuples * (nr_tuples - 1) / 2)) ** (1 / t))
+
+    estimates = []
+
+    for ps in [tuple_p, lrs_p]:
+        if len(ps) == 0:
+            estimates.append(None)
+        else:
+            estimates.append(-np.log2(upper_bound(max(ps), n)))
+
+    return estimates
+
+
+def prediction_entropy(correct, alphabet_size):
+    n = len(correct)
+    c = int(np.count_nonzero(correct))
+
+    # Global prediction rate
+    if c == 0:
+        p_global = 1 - 0.01 ** (1 / n)
+    else:
+        p_global = upper_bound(c / n, n)
+
+    # Longest run of correct predictions
+    padded = np.concatenate(([0], correct.astype(np.int8), [0]))
+    edges = np.diff(padded)
+    runs = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+    r = int(runs.max() if len(runs) > 0 else 0) + 1
+
+    def run_probability(p):
+        # Probability of no run longer than r - 1 in n predictions
+        q = 1 - p
+        x = np.float64(1.0)
+        for _ in range(10):
+            x = 1 + q * p ** r * x ** (r + 1)
+
+        return (1 - p * x) / ((r + 1 - r * x) * q) / x ** (n + 1)
+
+    # Large powers just vanish the probability
+    with np.errstate(over="ignore"):
+        p_local = bisect(run_probability, 0.99, 1e-12, 1 - 1e-12, increasing=False)
+
+    return -np.log2(max(p_global, p_local, 1 / alphabet_size))
+
+
+class scoreboard:
+    """
+    Picks the subpredictor of every prediction like the reference: the one
+    with the best score, ties go to the one that was last right, then to the
+    last one. Goes through the predictions one chunk at a time.
+    """
+    def __init__(self, nr_subpredictors):
+        self.totals = np.zeros(nr_subpredictors, dtype=np.int64)
+
+        # Position of the last right prediction of every subpredictor
+        self.last_hits = np.full(nr_subpredictors, -1, dtype=np.int64)
+        self.offset = 0
+
+    def winners(self, hits):
+        nr_predictions, nr_subpredictors = hits.shape
+        positions = self.offset + np.arange(nr_predictions)
+
+        # Scores and last right predictions before every prediction
+        scores = self.totals + np.cumsum(hits, axis=0) - hits
+        times = np.where(hits, positions[:, None], -1)
+        last = np.maximum.accumulate(np.vstack((self.last_hits, times)), axis=0)[:-1]
+
+        span = positions[-1] + 2
+        keys = (scores * span + last + 1) * nr_subpredictors + np.arange(nr_subpredictors)
+        chosen = np.argmax(keys, axis=1)
+
+        # Until one of them is right, the first one is used
+        chosen[scores.max(axis=1) == 0] = 0
+
+        self.totals += hits.sum(axis=0)
+        self.last_hits = np.maximum(self.last_hits, times.max(axis=0))
+        self.offset += nr_predictions
+
+        return chosen
+
+
+def multi_mcw(symbols):
+    n = len(symbols)
+    alphabet = int(symbols.max()) + 1
+    start = MCW_WINDOWS[0]
+
+    # Predictions of every window, for every position after the first window
+    predictions = np.full((n - start, len(MCW_WINDOWS)), -1, dtype=np.int64)
+
+    for j, w in enumerate(MCW_WINDOWS):
+        # Last position of every symbol before the first chunk, ties go to the most recent
+        last_seen = np.full(alphabet, -1, dtype=np.int64)
+        np.maximum.at(last_seen, symbols[:max(start, w)], np.arange(max(start, w)))
+
+        for chunk_start in range(max(start, w), n, PREDICTION_CHUNK):
+            chunk_end = min(chunk_start + PREDICTION_CHUNK, n)
+            positions = np.arange(chunk_start, chunk_end)
+            columns = np.arange(1, len(positions))
+
+            # Counts of the window right before every position of the chunk,
+            # one row per symbol so that the running sums are contiguous
+            counts = np.bincount(symbols[chunk_start - w:chunk_start], minlength=alphabet)
+            steps = np.zeros((alphabet, len(positions)), dtype=np.int16)
+            steps[symbols[positions[:-1]], columns] += 1
+            steps[symbols[positions[:-1] - w], columns] -= 1
+
+            windows = np.cumsum(steps, axis=1, dtype=np.int16)
+            windows += counts.astype(np.int16)[:, None]
+
+            # Last position of every symbol before every position of the chunk,
+            # counted from the start of the first window, 0 if none is in it
+            base = chunk_start - w - 1
+            marks = np.zeros((alphabet, len(positions)), dtype=np.int16)
+            marks[:, 0] = np.maximum(last_seen - base, 0)
+            marks[symbols[positions[:-1]], columns] = positions[:-1] - base
+            recent = np.maximum.accumulate(marks, axis=1)
+
+            last_seen = np.where(recent[:, -1] > 0, recent[:, -1].astype(np.int64) + base, -1)
+            last_seen[symbols[chunk_end - 1]] = chunk_end - 1
+
+            # The most frequent symbol, the most recent one among equals
+            keys = (windows.astype(np.int32) << 14) | recent
+            predictions[chunk_start - start:chunk_end - start, j] = np.argmax(keys, axis=0)
+
+    correct = predictions == symbols[start:, None]
+    chosen = predictions[np.arange(n - start), scoreboard(len(MCW_WINDOWS)).winners(correct)]
+
+    return prediction_entropy(chosen == symbols[start:], alphabet)
+
+
+def lag(symbols):
+    n = len(symbols)
+    alphabet = int(symbols.max()) + 1
+
+    lags = np.arange(1, LAG_DEPTH + 1)
+    board = scoreboard(LAG_DEPTH)
+    correct = []
+
+    # The first predictions only have the shortest lags
+    for i in range(1, min(LAG_DEPTH, n)):
+        hits = np.zeros((1, LAG_DEPTH), dtype=bool)
+        hits[0, :i] = symbols[i - lags[:i]] == symbols[i]
+
+        chosen = board.winners(hits)[0]
+        correct.append([chosen < i and symbols[i - lags[chosen]] == symbols[i]])
+
+    for chunk_start in range(LAG_DEPTH, n, PREDICTION_CHUNK):
+        positions = np.arange(chunk_start, min(chunk_start + PREDICTION_CHUNK, n))
+
+        # Predictions of every lag
+        predictions = symbols[positions[:, None] - lags]
+        hits = predictions == symbols[positions, None]
+
+        chosen = predictions[np.arange(len(positions)), board.winners(hits)]
+        correct.append(chosen == symbols[positions])
+
+    return prediction_entropy(np.concatenate(correct), alphabet)
+
+
+def context_ids(symbols, depth):
+    """
+    Numbers the contexts of every length up to depth: ids[d][p] identifies
+    the d symbols before position p, or is -1 for the first d positions.
+    """
+    n = len(symbols)
+    alphabet = int(symbols.max()) + 1
+
+    ids = [np.zeros(n, dtype=np.int64)]
+
+    for d in range(1, depth + 1):
+        # Prepend one more symbol to the contexts of length d - 1
+        keys = ids[-1][d:] * alphabet + symbols[:n - d]
+        _, inverse = np.unique(keys, return_inverse=True)
+
+        ids.append(np.concatenate((np.full(d, -1, dtype=np.int64), inverse.reshape(-1))))
+
+    return ids
+
+
+def occurrences(keys):
+    # How many times every key was seen so far, itself included
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+
+    starts = np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1]))
+    group_starts = np.maximum.accumulate(np.where(starts, np.arange(len(keys)), 0))
+
+    counts = np.empty(len(keys), dtype=np.int64)
+    counts[order] = np.arange(len(keys)) - group_starts + 1
+
+    return counts
+
+
+def running_best(contexts, events, queries):
+    """
+    For every position, the best event key seen strictly before it in the
+    same context, 0 if there is none. events must be positive, 0 for the
+    positions that have no event.
+    """
+    n = len(contexts)
+
+    # A query at p comes before the event at p, both in time order
+    merged_contexts = np.repeat(contexts, 2)
+    values = np.zeros(2 * n, dtype=np.int64)
+    values[1::2] = events
+
+    order = np.argsort(merged_contexts, kind="stable")
+    span = int(events.max()) + 1
+
+    # Running maximum within every context, the offsets keep them apart
+    offsets = merged_contexts[order] * span
+    best = np.maximum.accumulate(values[order] + offsets) - offsets
+
+    result = np.empty(2 * n, dtype=np.int64)
+    result[order] = best
+
+    return np.where(queries, result[0::2], 0)
+
+
+def multi_mmc(symbols, ids=None):
+    n = len(symbols)
+    alphabet = int(symbols.max()) + 1
+    positions = np.arange(n)
+
+    if ids is None:
+        ids = context_ids(symbols, MMC_DEPTH)
+
+    # Predictions from the third symbol on, -1 when there is none
+    predictions = np.full((n - 2, MMC_DEPTH), -1, dtype=np.int64)
+
+    for d in range(1, MMC_DEPTH + 1):
+        contexts = np.maximum(ids[d], 0)
+        valid = positions >= d
+
+        # Transitions from every context to the next symbol, counted as they come
+        pairs = np.where(valid, contexts * alphabet + symbols, -1)
+        counts = occurrences(pairs)
+
+        # New transitions are not counted once the table is full
+        new = np.flatnonzero(valid & (counts == 1))
+        if len(new) > MMC_MAX_ENTRIES:
+            _, first, inverse = np.unique(pairs, return_index=True, return_inverse=True)
+            valid &= first[inverse.reshape(-1)] < new[MMC_MAX_ENTRIES]
+
+        # The most frequent next symbol, the largest one among equals
+        events = np.where(valid, counts * alphabet + symbols + 1, 0)
+        best = running_best(contexts, events, valid)[2:]
+
+        predictions[:, d - 1] = np.where(best > 0, (best - 1) % alphabet, -1)
+
+    correct = predictions == symbols[2:, None]
+    chosen = predictions[np.arange(n - 2), scoreboard(MMC_DEPTH).winners(correct)]
+
+    return prediction_entropy(chosen == symbols[2:], alphabet)
+
+
+def lz78y(symbols, ids=None):
+    n = len(symbols)
+    alphabet = int(symbols.max()) + 1
+    positions = np.arange(n)
+    depth = LZ78Y_DEPTH
+
+    if ids is None:
+        ids = context_ids(symbols, depth)
+
+    # Contexts enter the dictionary when first seen, longest first, until it is full
+    counted = positions >= depth
+    first = []
+    for j in range(1, depth + 1):
+        seen = occurrences(np.where(counted, ids[j], -1)) == 1
+        first.append(positions[counted & seen] * depth + depth - j)
+
+    first = np.sort(np.concatenate(first))
+    cutoff = first[LZ78Y_MAX_DICTIONARY] if len(first) > LZ78Y_MAX_DICTIONARY else np.inf
+
+    # Count and symbol of the best prediction of every position, over all lengths
+    best_counts = np.zeros(n, dtype=np.int64)
+    best_symbols = np.full(n, -1, dtype=np.int64)
+
+    for j in range(depth, 0, -1):
+        contexts = np.maximum(ids[j], 0)
+
+        # Contexts left out of the full dictionary are never counted
+        first_key = np.full(contexts.max() + 1, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(first_key, contexts[counted], (positions * depth + depth - j)[counted])
+        in_dictionary = counted & (first_key[contexts] < cutoff)
+
+        # The most frequent next symbol, the largest one among equals
+        counts = occurrences(np.where(in_dictionary, contexts * alphabet + symbols, -1))
+        events = np.where(in_dictionary, counts * alphabet + symbols + 1, 0)
+        best = running_best(contexts, events, positions >= j)
+
+        # Longer contexts win ties
+        count = np.where(best > 0, (best - 1) // alphabet, 0)
+        better = count > best_counts
+        best_counts = np.where(better, count, best_counts)
+        best_symbols = np.where(better, (best - 1) % alphabet, best_symbols)
+
+    correct = best_symbols[depth + 1:] == symbols[depth + 1:]
+
+    return prediction_entropy(correct, alphabet)
+
+
+def run_estimators(symbols, binary):
+    t_tuple, lrs = t_tuple_and_lrs(symbols)
+
+    # Both predictors look at the same contexts
+    ids = context_ids(symbols, max(MMC_DEPTH, LZ78Y_DEPTH))
+
+    result = {"most_common_value": most_common_value(symbols)}
+
+    # These are only defined on the bitstring
+    if binary:
+        result.update({
+            "collision": collision(symbols),
+            "markov": markov(symbols),
+            "compression": compression(symbols),
+        })
+
+    result.update({
+        "t_tuple": t_tuple,
+        "lrs": lrs,
+        "multi_mcw": multi_mcw(symbols),
+        "lag": lag(symbols),
+        "multi_mmc": multi_mmc(symbols, ids),
+        "lz78y": lz78y(symbols, ids),
+    })
+
+    return result
+
+
+def estimate_min_entropy(data):
+    """
+    Runs the SP 800-90B non-IID estimators on the bytes of the data.
+
+    Returns the estimates on 8-bit symbols (bits per byte) and on the
+    bitstring (bits per bit), along with the combined assessment.
+    """
+    symbols = np.ascontiguousarray(data).reshape(-1).view(np.uint8)[:MAX_SYMBOLS]
+    bits = np.unpackbits(symbols)[:MAX_SYMBOLS]
+
+    # The bitstring goes through every estimator, the bytes through the ones
+    # that take any alphabet
+    byte_estimates = run_estimators(symbols, binary=False)
+    bit_estimates = run_estimators(bits, binary=True)
+
+    def lowest(estimates):
+        return min(e for e in estimates.values() if e is not None)
+
+    # Assessment per byte, the bitstring counts for all of its bits
+    assessment = min(lowest(byte_estimates), 8 * lowest(bit_estimates))
+
+    return byte_estimates, bit_estimates, assessment
+
+
+def min_entropy_summary(byte_estimates, bit_estimates, assessment):
+    lines = ["Estimates on 8-bit symbols (bits per byte):"]
+    lines += [
+        f"    {name:<20}{'-' if e is None else f'{e:.6f}'}"
+        for name, e in byte_estimates.items()
+    ]
+
+    lines += ["", "Estimates on the bitstring (bits per bit):"]
+    lines += [
+        f"    {name:<20}{'-' if e is None else f'{e:.6f}'}"
+        for name, e in bit_estimates.items()
+    ]
+
+    lines += ["", f"Min-entropy = {assessment:.6f} bits per byte."]
+
+    return "\n".join(lines) + "\n"
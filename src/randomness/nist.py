@@ -0,0 +1,592 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from os.path import getsize
+
+import numpy as np
+from scipy.special import erfc, gammaincc
+from scipy.stats import norm
+
+# Length of the independent sequences a capture is split into
+SEQUENCE_BITS = 1000000
+SEQUENCE_BYTES = SEQUENCE_BITS // 8
+
+# Below this a sequence is too short for the tests to mean anything
+MIN_SEQUENCE_BITS = 10000
+
+# Significance level and number of bins of the final analysis
+ALPHA = 0.01
+UNIFORMITY_BINS = 10
+
+BLOCK_FREQUENCY_M = 128
+
+# Longest run of ones: (minimum length, block length, class bounds, class probabilities)
+LONGEST_RUN_PARAMETERS = [
+    (750000, 10000, (10, 16), [0.0882, 0.2092, 0.2483, 0.1933, 0.1208, 0.0675, 0.0727]),
+    (6272, 128, (4, 9), [0.1174, 0.2430, 0.2493, 0.1752, 0.1027, 0.1124]),
+    (128, 8, (1, 4), [0.2148, 0.3672, 0.2305, 0.1875]),
+]
+
+RANK_SIZE = 32
+RANK_PROBABILITIES = np.array([0.2888, 0.5776, 0.1336])
+
+SERIAL_M = 16
+APPROXIMATE_ENTROPY_M = 10
+
+# Template length and number of blocks of the template matching tests
+TEMPLATE_M = 9
+NON_OVERLAPPING_BLOCKS = 8
+
+# Overlapping template of ones: block length, and the probabilities of 0 to 5 or more matches
+OVERLAPPING_BLOCK_LENGTH = 1032
+OVERLAPPING_PROBABILITIES = np.array(
+    [0.364091, 0.185659, 0.139381, 0.100571, 0.0704323, 0.139865])
+
+# Maurer's universal test: minimum length for every block length, from 6 bits
+UNIVERSAL_MIN_LENGTHS = [387840, 904960, 2068480, 4654080, 10342400, 22753280,
+                         49643520, 107560960, 231669760, 496435200, 1059061760]
+UNIVERSAL_EXPECTED = [0, 0.73264948, 1.5374383, 2.40160681, 3.31122472, 4.25342659,
+                      5.2177052, 6.1962507, 7.1836656, 8.1764248, 9.1723243, 10.170032,
+                      11.168765, 12.168070, 13.167693, 14.167488, 15.167379]
+UNIVERSAL_VARIANCE = [0, 0.690, 1.338, 1.901, 2.358, 2.705, 2.954, 3.125, 3.238, 3.311,
+                      3.356, 3.384, 3.401, 3.410, 3.416, 3.419, 3.421]
+
+# States of the random excursions tests, and the cycles needed for them to mean anything
+EXCURSION_STATES = [-4, -3, -2, -1, 1, 2, 3, 4]
+EXCURSION_VARIANT_STATES = list(range(-9, 0)) + list(range(1, 10))
+MIN_CYCLES = 500
+
+LINEAR_COMPLEXITY_M = 500
+LINEAR_COMPLEXITY_MIN_BLOCKS = 200
+LINEAR_COMPLEXITY_PROBABILITIES = np.array(
+    [0.010417, 0.03125, 0.125, 0.5, 0.25, 0.0625, 0.020833])
+
+
+def aperiodic_templates(m=TEMPLATE_M):
+    # Templates that cannot overlap with a shifted copy of themselves, as integers
+    templates = []
+
+    for value in range(2 ** m):
+        bits = [(value >> (m - 1 - i)) & 1 for i in range(m)]
+
+        if all(bits[k:] != bits[:m - k] for k in range(1, m)):
+            templates.append(value)
+
+    return templates
+
+
+TEMPLATES = aperiodic_templates()
+
+TESTS = [
+    "frequency",
+    "block_frequency",
+    "cumulative_sums_forward",
+    "cumulative_sums_backward",
+    "runs",
+    "longest_run",
+    "rank",
+    "dft",
+    "non_overlapping_template",
+    "overlapping_template",
+    "universal",
+    "approximate_entropy",
+    "random_excursions",
+    "random_excursions_variant",
+    "serial_1",
+    "serial_2",
+    "linear_complexity",
+]
+
+# Tests with one p-value per template or state, as in the reference suite
+TEST_VARIANTS = {
+    "non_overlapping_template": [f"{t:0{TEMPLATE_M}b}" for t in TEMPLATES],
+    "random_excursions": [f"{x:+d}" for x in EXCURSION_STATES],
+    "random_excursions_variant": [f"{x:+d}" for x in EXCURSION_VARIANT_STATES],
+}
+
+# Every p-value of a sequence, named after the test and its variant
+COLUMNS = [
+    f"{test}_{variant}" if test in TEST_VARIANTS else test
+    for test in TESTS
+    for variant in TEST_VARIANTS.get(test, [None])
+]
+
+# One p-value per column, NaN if the sequence is too short for it
+RESULT_DTYPE = np.dtype([(column, np.float64) for column in COLUMNS])
+
+
+def frequency(bits):
+    n = len(bits)
+    s = 2 * int(np.count_nonzero(bits)) - n
+
+    return erfc(abs(s) / np.sqrt(n) / np.sqrt(2))
+
+
+def block_frequency(bits, m=BLOCK_FREQUENCY_M):
+    nr_blocks = len(bits) // m
+    proportions = bits[:nr_blocks * m].reshape(nr_blocks, m).mean(axis=1)
+
+    chi_square = 4 * m * np.sum((proportions - 0.5) ** 2)
+
+    return gammaincc(nr_blocks / 2, chi_square / 2)
+
+
+def cumulative_sums(bits, reverse=False):
+    n = len(bits)
+    steps = 2 * bits.astype(np.int32) - 1
+
+    if reverse:
+        steps = steps[::-1]
+
+    z = int(np.max(np.abs(np.cumsum(steps))))
+    sqrt_n = np.sqrt(n)
+
+    # Integer division truncates towards zero, as in the reference code
+    k = np.arange(int((-n / z + 1) / 4), int((n / z - 1) / 4) + 1)
+    first = np.sum(norm.cdf((4 * k + 1) * z / sqrt_n) - norm.cdf((4 * k - 1) * z / sqrt_n))
+
+    k = np.arange(int((-n / z - 3) / 4), int((n / z - 1) / 4) + 1)
+    second = np.sum(norm.cdf((4 * k + 3) * z / sqrt_n) - norm.cdf((4 * k + 1) * z / sqrt_n))
+
+    return 1 - first + second
+
+
+def runs(bits):
+    n = len(bits)
+    pi = np.count_nonzero(bits) / n
+
+    # The frequency test would already fail
+    if abs(pi - 0.5) >= 2 / np.sqrt(n):
+        return 0.0
+
+    observed = 1 + np.count_nonzero(bits[1:] != bits[:-1])
+    expected = 2 * n * pi * (1 - pi)
+
+    return erfc(abs(observed - expected) / (2 * np.sqrt(2 * n) * pi * (1 - pi)))
+
+
+def longest_run(bits):
+    n = len(bits)
+
+    for min_n, m, (low, high), probabilities in LONGEST_RUN_PARAMETERS:
+        if n >= min_n:
+            break
+    else:
+        return np.nan
+
+    nr_blocks = n // m
+    blocks = bits[:nr_blocks * m].reshape(nr_blocks, m)
+
+    # Longest run of ones of every block, all blocks at once
+    padded = np.zeros((nr_blocks, m + 2), dtype=np.int8)
+    padded[:, 1:-1] = blocks
+    edges = np.diff(padded, axis=1)
+
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+
+    longest = np.zeros(nr_blocks, dtype=np.int64)
+    np.maximum.at(longest, rows, ends - starts)
+
+    counts = np.bincount(np.clip(longest, low, high) - low, minlength=high - low + 1)
+
+    expected = nr_blocks * np.array(probabilities)
+    chi_square = np.sum((counts - expected) ** 2 / expected)
+
+    return gammaincc((len(probabilities) - 1) / 2, chi_square / 2)
+
+
+def gf2_ranks(matrices):
+    # Every row of a matrix is a 32-bit word
+    rows = matrices.copy()
+    nr_matrices = len(rows)
+    indices = np.arange(nr_matrices)
+
+    used = np.zeros(rows.shape, dtype=bool)
+    ranks = np.zeros(nr_matrices, dtype=np.int64)
+
+    # Gaussian elimination over GF(2), on all matrices at once
+    for column in range(RANK_SIZE - 1, -1, -1):
+        has_bit = ((rows >> np.uint32(column)) & 1).astype(bool)
+        candidates = has_bit & ~used
+
+        found = candidates.any(axis=1)
+        pivots = np.argmax(candidates, axis=1)
+
+        pivot_rows = rows[indices, pivots]
+        used[indices[found], pivots[found]] = True
+
+        # Clear the column from every other row holding it
+        eliminate = has_bit & found[:, None]
+        eliminate[indices, pivots] = False
+        rows ^= np.where(eliminate, pivot_rows[:, None], np.uint32(0))
+
+        ranks += found
+
+    return ranks
+
+
+def rank(bits):
+    nr_matrices = len(bits) // (RANK_SIZE * RANK_SIZE)
+    if nr_matrices == 0:
+        return np.nan
+
+    words = np.packbits(bits[:nr_matrices * RANK_SIZE * RANK_SIZE]).view(">u4")
+    ranks = gf2_ranks(words.astype(np.uint32).reshape(nr_matrices, RANK_SIZE))
+
+    counts = np.array([
+        np.count_nonzero(ranks == RANK_SIZE),
+        np.count_nonzero(ranks == RANK_SIZE - 1),
+        np.count_nonzero(ranks < RANK_SIZE - 1),
+    ])
+
+    expected = nr_matrices * RANK_PROBABILITIES
+    chi_square = np.sum((counts - expected) ** 2 / expected)
+
+    return np.exp(-chi_square / 2)
+
+
+def dft(bits):
+    n = len(bits)
+    moduli = np.abs(np.fft.rfft(2.0 * bits - 1)[:n // 2])
+
+    threshold = np.sqrt(np.log(1 / 0.05) * n)
+    expected = 0.95 * n / 2
+    observed = np.count_nonzero(moduli < threshold)
+
+    d = (observed - expected) / np.sqrt(n * 0.95 * 0.05 / 4)
+
+    return erfc(abs(d) / np.sqrt(2))
+
+
+def pattern_counts(bits, m):
+    # Overlapping m-bit patterns, wrapping around the end of the sequence
+    if m == 0:
+        return np.array([len(bits)])
+
+    augmented = np.concatenate((bits, bits[:m - 1])).astype(np.int64)
+    n = len(bits)
+
+    values = np.zeros(n, dtype=np.int64)
+    for j in range(m):
+        values = (values << 1) | augmented[j:j + n]
+
+    return np.bincount(values, minlength=2 ** m)
+
+
+def psi_square(bits, m):
+    n = len(bits)
+    counts = pattern_counts(bits, m)
+
+    return 2 ** m / n * np.sum(counts.astype(np.float64) ** 2) - n
+
+
+def serial(bits, m=SERIAL_M):
+    # Pattern lengths have to be small compared to the sequence
+    m = min(m, int(np.log2(len(bits))) - 3)
+
+    psi = [psi_square(bits, m - i) for i in range(3)]
+    delta_1 = psi[0] - psi[1]
+    delta_2 = psi[0] - 2 * psi[1] + psi[2]
+
+    return gammaincc(2 ** (m - 2), delta_1 / 2), gammaincc(2 ** (m - 3), delta_2 / 2)
+
+
+def phi(bits, m):
+    n = len(bits)
+    frequencies = pattern_counts(bits, m) / n
+    frequencies = frequencies[frequencies > 0]
+
+    return np.sum(frequencies * np.log(frequencies))
+
+
+def approximate_entropy(bits, m=APPROXIMATE_ENTROPY_M):
+    n = len(bits)
+    m = min(m, int(np.log2(n)) - 6)
+
+    apen = phi(bits, m) - phi(bits, m + 1)
+    chi_square = 2 * n * (np.log(2) - apen)
+
+    return gammaincc(2 ** (m - 1), chi_square / 2)
+
+
+def window_values(bits, m):
+    # Value of the m bits starting at every position, without wrapping
+    n = len(bits) - m + 1
+    values = np.zeros(n, dtype=np.int64)
+
+    for j in range(m):
+        values = (values << 1) | bits[j:j + n]
+
+    return values
+
+
+def non_overlapping_template(bits, m=TEMPLATE_M, nr_blocks=NON_OVERLAPPING_BLOCKS):
+    block_length = len(bits) // nr_blocks
+    if block_length < m:
+        return np.full(len(TEMPLATES), np.nan)
+
+    blocks = bits[:nr_blocks * block_length].reshape(nr_blocks, block_length).astype(np.int64)
+
+    # Aperiodic templates never overlap, so every occurrence counts
+    values = np.stack([window_values(block, m) for block in blocks])
+    counts = np.stack([np.bincount(v, minlength=2 ** m) for v in values])[:, TEMPLATES]
+
+    mean = (block_length - m + 1) / 2 ** m
+    variance = block_length * (1 / 2 ** m - (2 * m - 1) / 2 ** (2 * m))
+    chi_square = np.sum((counts - mean) ** 2 / variance, axis=0)
+
+    return gammaincc(nr_blocks / 2, chi_square / 2)
+
+
+def overlapping_template(bits, m=TEMPLATE_M, block_length=OVERLAPPING_BLOCK_LENGTH,
+                         probabilities=OVERLAPPING_PROBABILITIES):
+    nr_blocks = len(bits) // block_length
+
+    # Every class has to be expected a few times
+    if nr_blocks * probabilities.min() < 5:
+        return np.nan
+
+    blocks = bits[:nr_blocks * block_length].reshape(nr_blocks, block_length)
+
+    # Windows of m ones, counted with sums over the blocks
+    sums = np.zeros((nr_blocks, block_length + 1), dtype=np.int64)
+    np.cumsum(blocks, axis=1, out=sums[:, 1:])
+    matches = np.count_nonzero(sums[:, m:] - sums[:, :-m] == m, axis=1)
+
+    counts = np.bincount(np.minimum(matches, len(probabilities) - 1),
+                         minlength=len(probabilities))
+
+    expected = nr_blocks * probabilities
+    chi_square = np.sum((counts - expected) ** 2 / expected)
+
+    return gammaincc((len(probabilities) - 1) / 2, chi_square / 2)
+
+
+def universal(bits, L=None, Q=None):
+    n = len(bits)
+
+    if L is None:
+        L = 5 + np.searchsorted(UNIVERSAL_MIN_LENGTHS, n, side="right")
+        if L == 5:
+            return np.nan
+
+    if Q is None:
+        Q = 10 * 2 ** L
+
+    K = n // L - Q
+
+    # Every block as an integer, the first Q only initialise the table
+    blocks = bits[:(Q + K) * L].reshape(Q + K, L).astype(np.int64)
+    values = blocks @ (1 << np.arange(L - 1, -1, -1))
+
+    # Previous block with the same value, 0 if there is none, with 1-based positions
+    order = np.argsort(values, kind="stable")
+    sorted_values = values[order]
+    previous = np.zeros(Q + K, dtype=np.int64)
+    same = sorted_values[1:] == sorted_values[:-1]
+    previous[order[1:][same]] = order[:-1][same] + 1
+
+    positions = np.arange(1, Q + K + 1)
+    fn = np.sum(np.log2(positions[Q:] - previous[Q:])) / K
+
+    c = 0.7 - 0.8 / L + (4 + 32 / L) * K ** (-3 / L) / 15
+    sigma = c * np.sqrt(UNIVERSAL_VARIANCE[L] / K)
+
+    return erfc(abs(fn - UNIVERSAL_EXPECTED[L]) / (np.sqrt(2) * sigma))
+
+
+def excursion_cycles(bits):
+    # Random walk, and the cycle of every step, a cycle ends when the walk is back at 0
+    walk = np.cumsum(2 * bits.astype(np.int64) - 1)
+    zeros = walk == 0
+
+    cycles = np.zeros(len(walk), dtype=np.int64)
+    np.cumsum(zeros[:-1], out=cycles[1:])
+
+    # The walk is closed at the end when it is not already at 0
+    nr_cycles = int(np.count_nonzero(zeros)) + (walk[-1] != 0)
+
+    return walk, cycles, nr_cycles
+
+
+def random_excursions(bits, min_cycles=MIN_CYCLES):
+    walk, cycles, nr_cycles = excursion_cycles(bits)
+
+    if nr_cycles < max(0.005 * np.sqrt(len(bits)), min_cycles):
+        return np.full(len(EXCURSION_STATES), np.nan)
+
+    p_values = []
+
+    for x in EXCURSION_STATES:
+        # Visits of every cycle to the state, 5 or more in the same class
+        visits = np.bincount(cycles[walk == x], minlength=nr_cycles)
+        counts = np.bincount(np.minimum(visits, 5), minlength=6)
+
+        a = 1 - 1 / (2 * abs(x))
+        probabilities = np.array(
+            [a] + [a ** (k - 1) / (4 * x * x) for k in range(1, 5)] + [a ** 4 / (2 * abs(x))])
+
+        expected = nr_cycles * probabilities
+        chi_square = np.sum((counts - expected) ** 2 / expected)
+        p_values.append(gammaincc(5 / 2, chi_square / 2))
+
+    return np.array(p_values)
+
+
+def random_excursions_variant(bits, min_cycles=MIN_CYCLES):
+    walk, _, nr_cycles = excursion_cycles(bits)
+
+    if nr_cycles < max(0.005 * np.sqrt(len(bits)), min_cycles):
+        return np.full(len(EXCURSION_VARIANT_STATES), np.nan)
+
+    states = np.array(EXCURSION_VARIANT_STATES)
+    visits = np.bincount(walk[np.abs(walk) <= 9] + 9, minlength=19)[states + 9]
+
+    return erfc(np.abs(visits - nr_cycles) / np.sqrt(2 * nr_cycles * (4 * np.abs(states) - 2)))
+
+
+def linear_complexities(blocks):
+    """
+    Length of the shortest LFSR generating every block, with the
+    Berlekamp-Massey algorithm running on all blocks at once.
+    """
+    nr_blocks, m = blocks.shape
+    s = blocks.astype(bool)
+
+    # Connection polynomials, and the last one before a length change already
+    # shifted by the steps since, lowest degree first
+    c = np.zeros((nr_blocks, m + 1), dtype=bool)
+    c[:, 0] = True
+    b = np.zeros((nr_blocks, m + 1), dtype=bool)
+    b[:, 1] = True
+
+    lengths = np.zeros(nr_blocks, dtype=np.int64)
+
+    for n in range(m):
+        # Discrepancy of the next bit with the one the polynomial predicts
+        d = (np.count_nonzero(c[:, :n + 1] & s[:, n::-1], axis=1) & 1).astype(bool)
+        grow = d & (2 * lengths <= n)
+
+        previous = c[grow]
+        c[d] ^= b[d]
+
+        lengths[grow] = n + 1 - lengths[grow]
+        b[grow] = previous
+
+        # One more step since the last change
+        b[:, 1:] = b[:, :-1].copy()
+        b[:, 0] = False
+
+    return lengths
+
+
+def linear_complexity(bits, m=LINEAR_COMPLEXITY_M, probabilities=LINEAR_COMPLEXITY_PROBABILITIES):
+    nr_blocks = len(bits) // m
+    if nr_blocks < LINEAR_COMPLEXITY_MIN_BLOCKS:
+        return np.nan
+
+    lengths = linear_complexities(bits[:nr_blocks * m].reshape(nr_blocks, m))
+
+    mean = m / 2 + (9 + (-1) ** (m + 1)) / 36 - (m / 3 + 2 / 9) / 2 ** m
+    t = (-1) ** m * (lengths - mean) + 2 / 9
+
+    # Classes of width 1 centered on the integers from -3 to 3, the outer ones are open
+    classes = np.clip(np.ceil(t - 0.5).astype(np.int64), -3, 3) + 3
+    counts = np.bincount(classes, minlength=len(probabilities))
+
+    expected = nr_blocks * probabilities
+    chi_square = np.sum((counts - expected) ** 2 / expected)
+
+    return gammaincc((len(probabilities) - 1) / 2, chi_square / 2)
+
+
+def set_variants(results, test, p_values):
+    for variant, p_value in zip(TEST_VARIANTS[test], p_values):
+        results[f"{test}_{variant}"] = p_value
+
+
+def nist_test_sequence(bits):
+    results = np.empty(1, dtype=RESULT_DTYPE)
+
+    results["frequency"] = frequency(bits)
+    results["block_frequency"] = block_frequency(bits)
+    results["cumulative_sums_forward"] = cumulative_sums(bits)
+    results["cumulative_sums_backward"] = cumulative_sums(bits, reverse=True)
+    results["runs"] = runs(bits)
+    results["longest_run"] = longest_run(bits)
+    results["rank"] = rank(bits)
+    results["dft"] = dft(bits)
+    set_variants(results, "non_overlapping_template", non_overlapping_template(bits))
+    results["overlapping_template"] = overlapping_template(bits)
+    results["universal"] = universal(bits)
+    results["approximate_entropy"] = approximate_entropy(bits)
+    set_variants(results, "random_excursions", random_excursions(bits))
+    set_variants(results, "random_excursions_variant", random_excursions_variant(bits))
+    results["serial_1"], results["serial_2"] = serial(bits)
+    results["linear_complexity"] = linear_complexity(bits)
+
+    return results
+
+
+def nist_test_shard(file_path, offset, size, sequence_bytes, sequence):
+    data = np.memmap(file_path, dtype=np.uint8, mode="r", offset=offset, shape=(size,))
+
+    start = sequence * sequence_bytes
+    bits = np.unpackbits(data[start:start + sequence_bytes])
+
+    return nist_test_sequence(bits)
+
+
+def nist_test_file(file_path, offset=0, size=None, sequence_bits=SEQUENCE_BITS, max_workers=None):
+    """
+    Splits the bytes of a file into independent sequences and runs the
+    SP 800-22 tests on each of them, in parallel.
+
+    Returns a structured array with the p-values of every sequence.
+    """
+    if size is None:
+        size = getsize(file_path) - offset
+
+    # Short captures make a single, shorter sequence
+    sequence_bytes = min(sequence_bits // 8, size)
+    if sequence_bytes * 8 < MIN_SEQUENCE_BITS:
+        return np.empty(0, dtype=RESULT_DTYPE)
+
+    nr_sequences = size // sequence_bytes
+    shard_func = partial(nist_test_shard, file_path, offset, size, sequence_bytes)
+
+    if nr_sequences == 1:
+        return shard_func(0)
+
+    with ProcessPoolExecutor(max_workers) as executor:
+        return np.concatenate(list(executor.map(shard_func, range(nr_sequences))))
+
+
+def nist_summary(results):
+    # Same figures as the final analysis report of the reference suite
+    lines = [f"{'test':<36}{'sequences':>10}{'passed':>10}{'proportion':>12}{'uniformity':>12}"]
+
+    for test in COLUMNS:
+        p_values = results[test][~np.isnan(results[test])]
+        nr_sequences = len(p_values)
+
+        # Too short for the test, or too few cycles for the random excursions
+        if nr_sequences == 0:
+            lines.append(f"{test:<36}{0:>10}")
+            continue
+
+        passed = np.count_nonzero(p_values >= ALPHA)
+
+        # The p-values themselves should be uniformly distributed
+        counts, _ = np.histogram(p_values, bins=UNIFORMITY_BINS, range=(0, 1))
+        expected = nr_sequences / UNIFORMITY_BINS
+        chi_square = np.sum((counts - expected) ** 2 / expected)
+        uniformity = gammaincc((UNIFORMITY_BINS - 1) / 2, chi_square / 2)
+
+        lines.append(
+            f"{test:<36}{nr_sequences:>10}{passed:>10}"
+            + f"{passed / nr_sequences:>12.4f}{uniformity:>12.6f}"
+        )
+
+    return "\n".join(lines) + "\n"
@@ -5,7 +5,9 @@ SOURCE_FORMAT='''Source must be in one of the following formats:
     - name(option_1=val_1,...,option_n=val_n)
 Examples:
     - osrandom
+    - osrandom(chunk_size=65536, urandom=True)
     - fm(freqs=["80M", "160M"], gain="33.8", ppm="50")
+    - fm(freqs=["80M", "160M"], devices=[0, 1], restarts=3)
 '''
 
 OPERATIONS_FORMAT='''Operations must be in one of the following formats:
@@ -35,6 +37,8 @@ TESTS_FORMAT='''Tests must be in one of the following format:
 Examples:
     - ent
     - [ent, rngtest]
+    - [rngtest, nist]
+    - [min_entropy]
 '''
 
 BANNER=f'''Command-line tool for prototyping TRNGs.
@@ -1,32 +1,58 @@
 from enum import Flag, auto
 
 from os.path import join
-from os import listdir, makedirs
+from os import makedirs
 from pathlib import Path
 
 from concurrent.futures import ThreadPoolExecutor
-from subprocess import Popen, PIPE
 
-from utils.lazy import lazy_wav_blocks
+import json
+import numpy as np
+
+from utils.products import list_products, open_product
+
+# The tests themselves are imported when they run, scipy is slow to import
+
+# Samples read at once by the streaming tests
+ENT_BLOCK_SIZE = 1024 * 1024
+MIN_ENTROPY_BLOCK_SIZE = 64 * 1024
 
 
 class test_type(Flag):
     NONE = auto()
     ENT = auto()
     RNGTEST = auto()
+    NIST = auto()
+    MIN_ENTROPY = auto()
+
+    def streamed(self):
+        # Tests that can be computed while the data is being written
+        return self & test_type.ENT
+
+    def monitors(self, eval_dir, file):
+        # Nothing to do if no test can be streamed
+        if not self.streamed():
+            return []
+
+        # Set the base directory for the results of a file
+        base = join(eval_dir, Path(file).stem)
+        makedirs(base, exist_ok=True)
+
+        monitors = []
+
+        if self & test_type.ENT:
+            monitors.append(ent_monitor(join(base, "ent.txt")))
+
+        return monitors
 
     def execute(self, audio_dir, eval_dir):
         # Skip if no tests are requested
-        if self == test_type.NONE:
+        if not self & ~test_type.NONE:
             return
 
         with ThreadPoolExecutor() as executor:
-            # Iterate through all wav files in the directory
-            for file in listdir(audio_dir):
-                # skip if it isn't a wav file
-                if not file.endswith(".wav"):
-                    continue
-
+            # Iterate through all the products in the directory
+            for file in list_products(audio_dir):
                 name = Path(file).stem
                 file = join(audio_dir, file)
 
@@ -42,46 +68,105 @@ class test_type(Flag):
                     test = join(base, "rngtest.txt")
                     executor.submit(test_rngtest, file, test)
 
+                if self & test_type.NIST:
+                    test = join(base, "nist.txt")
+                    executor.submit(test_nist, file, test)
+
+                if self & test_type.MIN_ENTROPY:
+                    test = join(base, "min_entropy.txt")
+                    executor.submit(test_min_entropy, file, test)
+
+
+class ent_monitor:
+    # Computes ent on the fly, while the data is being written
+    def __init__(self, output):
+        from randomness.ent import ent_accumulator
+
+        self.output = output
+        self.accumulator = ent_accumulator()
+
+    def update(self, block):
+        self.accumulator.update(block)
+
+    def close(self):
+        with open(self.output, "w") as o:
+            o.write(self.accumulator.report())
+
 
 def test_ent(audio_file, output):
     # Evaluate blocks as needed
-    blocks = lazy_wav_blocks(audio_file)
+    blocks = open_product(audio_file, ENT_BLOCK_SIZE)
 
-    with open(output, "w") as o:
-        # Open a subprocess and send the blocks one by one
-        with Popen(["ent"], stdin=PIPE, stdout=o) as proc:
-            try:
-                for block in blocks:
-                    raw_bytes = block.astype(blocks.dtype).tobytes()
-                    proc.stdin.write(raw_bytes)
-                proc.stdin.close()
+    monitor = ent_monitor(output)
+
+    for block in blocks:
+        monitor.update(block)
 
-            except Exception as e:
-                proc.kill()
-                raise e
+    monitor.close()
 
 
 def test_rngtest(audio_file, output):
-    # Evaluate blocks as needed
-    blocks = lazy_wav_blocks(audio_file)
-
-    # Open a subprocess and send the blocks one by one
-    with Popen(["rngtest"], stdin=PIPE, stderr=PIPE) as proc:
-        try:
-            for block in blocks:
-                raw_bytes = block.astype(blocks.dtype).tobytes()
-                proc.stdin.write(raw_bytes)
-            proc.stdin.close()
-
-            # Open the output file
-            with open(output, "w") as o:
-                # Enumerate over the output lines
-                for i, line in enumerate(iter(proc.stderr.readline, b"")):
-                    line = line.decode()  # convert bytes to string
-                    # Write only a range of lines
-                    if 7 <= i < 15:
-                        o.write(line)
-
-        except Exception as e:
-            proc.kill()
-            raise e
+    from randomness.fips import fips_summary, fips_test_file
+
+    # Only the samples are tested, not the header
+    product = open_product(audio_file)
+
+    # Run the FIPS 140-2 tests over all the blocks, in parallel
+    results = fips_test_file(audio_file, product.data_offset, product.data_size)
+
+    # Write the same summary as rngtest
+    with open(output, "w") as o:
+        o.write(fips_summary(results, product.data_size * 8))
+
+    # Keep the results of every block next to the summary
+    np.save(Path(output).with_suffix(".npy"), results)
+
+
+def test_nist(audio_file, output):
+    from randomness.nist import nist_summary, nist_test_file
+
+    # Only the samples are tested, not the header
+    product = open_product(audio_file)
+
+    # Run the SP 800-22 tests over independent sequences, in parallel
+    results = nist_test_file(audio_file, product.data_offset, product.data_size)
+
+    with open(output, "w") as o:
+        o.write(nist_summary(results))
+
+    # Keep the p-values of every sequence next to the summary
+    np.save(Path(output).with_suffix(".npy"), results)
+
+
+def test_min_entropy(audio_file, output):
+    from randomness.min_entropy import MAX_SYMBOLS, estimate_min_entropy, min_entropy_summary
+
+    # Only the first samples are needed, stop reading once there are enough
+    blocks = []
+    nr_bytes = 0
+
+    for block in open_product(audio_file, MIN_ENTROPY_BLOCK_SIZE):
+        blocks.append(block.reshape(-1))
+        nr_bytes += block.nbytes
+
+        if nr_bytes >= MAX_SYMBOLS:
+            break
+
+    # Too little data to estimate anything
+    if nr_bytes == 0:
+        with open(output, "w") as o:
+            o.write("No data.\n")
+        return
+
+    byte_estimates, bit_estimates, assessment = estimate_min_entropy(np.concatenate(blocks))
+
+    with open(output, "w") as o:
+        o.write(min_entropy_summary(byte_estimates, bit_estimates, assessment))
+
+    # Keep the estimates next to the summary
+    with open(Path(output).with_suffix(".json"), "w") as o:
+        json.dump({
+            "bytes": byte_estimates,
+            "bits": bit_estimates,
+            "min_entropy": assessment,
+        }, o, indent=4)
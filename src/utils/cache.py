@@ -0,0 +1,119 @@
+import hashlib
+import shutil
+
+from os import link, makedirs, remove, replace, scandir, utime
+from os.path import exists, join
+
+import numpy as np
+
+# Bytes hashed at once when keying a source file
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Attributes that only say where the data lives, not what it is
+LOCATION_ATTRIBUTES = {"audio_dir", "product_dir", "eval_dir"}
+
+
+def file_key(file_path):
+    # Sources are keyed by their contents
+    h = hashlib.sha256()
+
+    with open(file_path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def describe(value):
+    # Arrays are too long for repr, hash their contents instead
+    if isinstance(value, np.ndarray):
+        digest = hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()
+        return f"ndarray({value.dtype}, {value.shape}, {digest})"
+
+    return repr(value)
+
+
+def operation_key(input_key, op):
+    """
+    Keys the product of an operation by its input, the operation class,
+    its parameters and its block size.
+    """
+    h = hashlib.sha256()
+    h.update(input_key.encode())
+    h.update(f"{type(op).__module__}.{type(op).__qualname__}".encode())
+
+    # Parameters, and everything the constructor derived from them
+    for name, value in sorted(vars(op).items()):
+        if name not in LOCATION_ATTRIBUTES:
+            h.update(f"{name}={describe(value)};".encode())
+
+    return h.hexdigest()
+
+
+def link_or_copy(source, destination):
+    # Links are free, but do not work across file systems
+    temporary = destination + ".tmp"
+
+    if exists(temporary):
+        remove(temporary)
+
+    try:
+        link(source, temporary)
+    except OSError:
+        shutil.copyfile(source, temporary)
+
+    # Readers never see a partial file
+    replace(temporary, destination)
+
+
+class product_cache:
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+        makedirs(self.cache_dir, exist_ok=True)
+
+    def path(self, key):
+        # Products of any format, the key already depends on it
+        return join(self.cache_dir, key[:2], key)
+
+    def contains(self, key):
+        return exists(self.path(key))
+
+    def restore(self, key, product_file):
+        path = self.path(key)
+
+        # The modification time keeps track of the last use
+        utime(path)
+
+        link_or_copy(path, product_file)
+
+    def store(self, key, product_file):
+        path = self.path(key)
+        makedirs(join(self.cache_dir, key[:2]), exist_ok=True)
+
+        link_or_copy(product_file, path)
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+
+        for directory in scandir(self.cache_dir):
+            if not directory.is_dir():
+                continue
+
+            for entry in scandir(directory.path):
+                if not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in entries)
+
+        # Remove the least recently used products first
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+
+            remove(path)
+            total_size -= size
@@ -1,3 +1,4 @@
+import wave
 import numpy as np
 
 def sample_width_to_np_dtype(sw):
@@ -6,3 +7,14 @@ def sample_width_to_np_dtype(sw):
         2: np.int16,   # Standard 16-bit PCM
         4: np.int32    # 32-bit PCM
     }.get(sw)
+
+
+def write_wav(file_path, sample_rate, data):
+    # Same output as scipy.io.wavfile.write for PCM data, without importing scipy
+    data = np.asarray(data)
+
+    with wave.open(file_path, 'wb') as wav_file:
+        wav_file.setnchannels(1 if data.ndim == 1 else data.shape[1])
+        wav_file.setsampwidth(data.dtype.itemsize)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(np.ascontiguousarray(data, dtype=data.dtype.newbyteorder('<')).tobytes())
@@ -0,0 +1,170 @@
+import json
+import resource
+import time
+
+from contextlib import contextmanager
+from multiprocessing import active_children
+from os import cpu_count, listdir, makedirs, sysconf
+from os.path import getsize, isdir, join
+
+from utils.products import product_format_of
+
+# Clock ticks per second, the unit of the CPU times in /proc
+CLOCK_TICKS = sysconf("SC_CLK_TCK")
+
+
+def live_children_cpu():
+    """
+    CPU time of the worker processes that are still running, by pid. Their
+    time only shows in getrusage once they are waited for.
+    """
+    times = {}
+
+    for child in active_children():
+        try:
+            with open(f"/proc/{child.pid}/stat") as f:
+                # The command name may contain spaces, the fields start after it
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+
+        # User and system time
+        times[child.pid] = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+    return times
+
+
+def children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def product_bytes(dirs):
+    # Size of the products in the directories, recursively
+    total = 0
+
+    for d in dirs:
+        if not isdir(d):
+            continue
+
+        for file in listdir(d):
+            path = join(d, file)
+            if isdir(path):
+                total += product_bytes([path])
+            elif product_format_of(file) is not None:
+                total += getsize(path)
+
+    return total
+
+
+class block_counter:
+    # Looks at every block of a product, like the streamed tests do
+    def __init__(self, record):
+        self.record = record
+
+    def update(self, block):
+        self.record["blocks"] += 1
+        self.record["bytes"] += block.nbytes
+
+    def close(self):
+        self.record["files"] += 1
+
+
+class instrument:
+    """
+    Records the cost of every stage of a run: wall and CPU time, bytes in
+    and out, worker utilisation and peak memory, and optionally a profile.
+    """
+    def __init__(self, profile_dir=None):
+        self.stages = []
+        self.products = {}
+
+        # Time spent writing the products, and waiting for the disk
+        self.writes = {}
+
+        # Dump a cProfile of every stage here, if set
+        self.profile_dir = profile_dir
+
+    @contextmanager
+    def stage(self, name, input_dirs=(), output_dirs=()):
+        input_bytes = product_bytes(input_dirs)
+
+        profiler = None
+        if self.profile_dir is not None:
+            import cProfile
+            profiler = cProfile.Profile()
+
+        # Workers that end during the stage move from the live ones to getrusage
+        live_start = live_children_cpu()
+        children_start = children_cpu()
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+
+        if profiler is not None:
+            profiler.enable()
+
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+
+            wall = time.perf_counter() - start
+            cpu = time.process_time() - cpu_start
+            workers_cpu = (sum(live_children_cpu().values()) - sum(live_start.values())
+                           + children_cpu() - children_start)
+
+            output_bytes = product_bytes(output_dirs)
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+            record = {
+                "name": name,
+                "wall_seconds": wall,
+                "cpu_seconds": cpu,
+                "workers_cpu_seconds": workers_cpu,
+                "worker_utilisation": workers_cpu / (wall * cpu_count()) if wall > 0 else 0,
+                "input_bytes": input_bytes,
+                "output_bytes": output_bytes,
+                "mb_per_second": max(input_bytes, output_bytes) / 1e6 / wall if wall > 0 else 0,
+                # Both are the highest so far, in kB on Linux
+                "peak_rss_bytes": usage.ru_maxrss * 1024,
+                "children_peak_rss_bytes": children_usage.ru_maxrss * 1024,
+            }
+
+            if profiler is not None:
+                makedirs(self.profile_dir, exist_ok=True)
+                record["profile"] = join(self.profile_dir,
+                                         f"{len(self.stages):02}_{name.split()[0]}.prof")
+                profiler.dump_stats(record["profile"])
+
+            self.stages.append(record)
+
+    def monitors(self, op):
+        # Count the blocks and bytes of the products of every operation
+        record = self.products.setdefault(op.product_dir, {
+            "operation": type(op).__name__,
+            "product_dir": op.product_dir,
+            "files": 0,
+            "blocks": 0,
+            "bytes": 0,
+        })
+
+        return [block_counter(record)]
+
+    def add_writes(self, write_stats):
+        # The writes of every product directory, from the writer threads
+        for product_dir, stats in write_stats.items():
+            self.writes[product_dir] = dict(stats, product_dir=product_dir)
+
+            if stats["stalls"] > 0:
+                print(f"Writing {product_dir} stalled {stats['stalls']} times, "
+                      + f"{stats['stall_seconds']:.2f} s in total.")
+
+    def write(self, file_path):
+        with open(file_path, "w") as f:
+            json.dump({
+                "stages": self.stages,
+                "products": list(self.products.values()),
+                "writes": list(self.writes.values()),
+            }, f, indent=4)
@@ -2,6 +2,7 @@ import wave
 import numpy as np
 
 from utils.data import sample_width_to_np_dtype
+from utils.riff import read_wav_header
 
 class lazy_wav_blocks:
     def __init__(self, file_path, block_size=1024):
@@ -35,3 +36,122 @@ class lazy_wav_blocks:
                 yield samples
 
 
+class mapped_blocks:
+    """
+    Blocks of samples stored contiguously in a file, mapped and not copied.
+    """
+    def __init__(self, file_path, dtype, data_offset, num_frames, num_channels=1,
+                 frame_rate=None, block_size=1024):
+        self.file_path = file_path
+        self.block_size = block_size
+
+        self.dtype = np.dtype(dtype)
+        self.sample_width = self.dtype.itemsize
+        self.num_channels = num_channels
+        self.frame_rate = frame_rate
+        self.num_frames = num_frames
+
+        # Where the samples are in the file
+        self.data_offset = data_offset
+        self.data_size = num_frames * num_channels * self.sample_width
+
+        # Empty files cannot be mapped
+        if self.num_frames == 0:
+            self.samples = np.empty(0, dtype=self.dtype)
+        else:
+            self.samples = np.memmap(
+                self.file_path,
+                dtype=self.dtype,
+                mode="r",
+                offset=data_offset,
+                shape=(self.num_frames * self.num_channels,),
+            )
+
+        if self.num_channels > 1:
+            self.samples = self.samples.reshape(-1, self.num_channels)
+
+    def __len__(self):
+        if self.num_frames == 0:
+            return 0
+
+        return -(-self.num_frames // self.block_size)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+
+        if not 0 <= index < len(self):
+            raise IndexError(f"Block index out of range: {index}")
+
+        # Views into the mapping, no data is copied
+        start = index * self.block_size
+        return self.samples[start:start + self.block_size]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class mapped_wav_blocks(mapped_blocks):
+    def __init__(self, file_path, block_size=1024):
+        # Parse the RIFF header once
+        header = read_wav_header(file_path)
+
+        # Map sample width to numpy dtype
+        dtype = sample_width_to_np_dtype(header.sample_width)
+
+        if dtype is None:
+            raise ValueError(f"Unsupported sample width: {header.sample_width}")
+
+        # Samples in WAV files are always little endian
+        dtype = np.dtype(dtype).newbyteorder("<")
+
+        super().__init__(file_path, dtype, header.data_offset, header.num_frames,
+                         header.num_channels, header.frame_rate, block_size)
+
+
+def rechunk_blocks(blocks, block_size=None):
+    # Samples waiting to fill up a block
+    pending = []
+    nr_pending = 0
+
+    for block in blocks:
+        # Skip empty blocks, they carry no samples
+        if len(block) == 0:
+            continue
+
+        pending.append(block)
+        nr_pending += len(block)
+
+        # Without a block size all the samples form a single block
+        if block_size is None or nr_pending < block_size:
+            continue
+
+        # Join the pending samples only once
+        samples = np.concatenate(pending) if len(pending) > 1 else pending[0]
+
+        # Emit as many full blocks as possible
+        nr_full = (nr_pending // block_size) * block_size
+        for start in range(0, nr_full, block_size):
+            yield samples[start:start + block_size]
+
+        # Keep the remainder for the next blocks
+        pending = [samples[nr_full:]] if nr_full < nr_pending else []
+        nr_pending -= nr_full
+
+    # The last block may be shorter, exactly like the last block of a file
+    if nr_pending > 0:
+        yield np.concatenate(pending) if len(pending) > 1 else pending[0]
+
+
+def batch_blocks(blocks, block_size, nr_blocks):
+    # Stack consecutive blocks, one per row
+    for samples in rechunk_blocks(blocks, block_size * nr_blocks):
+        nr_full = (len(samples) // block_size) * block_size
+
+        if nr_full > 0:
+            yield samples[:nr_full].reshape(-1, block_size)
+
+        # The last block may be shorter, it gets a batch of its own
+        if nr_full < len(samples):
+            yield samples[nr_full:].reshape(1, -1)
@@ -0,0 +1,286 @@
+import struct
+import time
+import wave
+
+from os import listdir
+from os.path import getsize, isfile, join
+from pathlib import Path
+
+import numpy as np
+
+from utils.data import sample_width_to_np_dtype
+from utils.lazy import mapped_blocks, mapped_wav_blocks
+from utils.writer import DEFAULT_NR_BUFFERS, buffered_writer
+
+# Bytes kept in memory before writing a product
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+# The header of .npy products has a fixed size, so the length can be patched at the end
+NPY_HEADER_SIZE = 128
+
+# Layout of the chunked store: header, samples, the frames of every block, footer
+CHUNKED_MAGIC = b"TRNGCHNK"
+CHUNKED_HEADER = struct.Struct("<8s8sIH6x")
+CHUNKED_FOOTER = struct.Struct("<QQ8s")
+
+
+class product_writer:
+    """
+    Writes the blocks of a product to a file, from a background thread with
+    nr_buffers buffers of buffer_size bytes. A buffer size of 0 writes every
+    block right away. The samples are stored in the dtype of the blocks.
+    """
+    def __init__(self, file_path, sample_rate, nchannels, sampwidth,
+                 buffer_size=DEFAULT_BUFFER_SIZE, nr_buffers=DEFAULT_NR_BUFFERS):
+        self.file_path = file_path
+        self.sample_rate = sample_rate
+        self.nchannels = nchannels
+
+        # Until a block says otherwise, the samples are as wide as the input
+        self.dtype = np.dtype(sample_width_to_np_dtype(sampwidth)).newbyteorder("<")
+
+        self.nr_blocks = 0
+        self.nr_bytes = 0
+
+        # Time spent writing while the producer waits
+        self.write_seconds = 0
+
+        self.file = self.open()
+
+        self.buffers = None
+        if buffer_size > 0:
+            self.buffers = buffered_writer(self.write_bytes, buffer_size, nr_buffers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self):
+        return open(self.file_path, "wb")
+
+    def write_bytes(self, data):
+        self.file.write(data)
+
+    def write(self, block):
+        if self.nr_blocks == 0:
+            self.dtype = block.dtype.newbyteorder("<")
+
+        # The samples are copied once, straight into the buffers
+        block = np.ascontiguousarray(block)
+        self.nr_blocks += 1
+        self.nr_bytes += block.nbytes
+
+        if self.buffers is not None:
+            self.buffers.write(block)
+            return
+
+        start = time.perf_counter()
+        self.write_bytes(memoryview(block).cast("B"))
+        self.write_seconds += time.perf_counter() - start
+
+    def close(self):
+        if self.file is None:
+            return
+
+        try:
+            # Wait for the buffers to reach the file
+            if self.buffers is not None:
+                self.buffers.close()
+
+            self.finish()
+        finally:
+            self.file.close()
+            self.file = None
+
+    def finish(self):
+        pass
+
+    def stats(self):
+        if self.buffers is not None:
+            return self.buffers.stats()
+
+        # Every write stalls the producer
+        return {
+            "bytes": self.nr_bytes,
+            "buffers": self.nr_blocks,
+            "write_seconds": self.write_seconds,
+            "stalls": self.nr_blocks,
+            "stall_seconds": self.write_seconds,
+        }
+
+
+class wav_writer(product_writer):
+    def open(self):
+        # The frames keep the sample width of the input, like the sources
+        wf = wave.open(self.file_path, "wb")
+        wf.setnchannels(self.nchannels)
+        wf.setsampwidth(self.dtype.itemsize)
+        wf.setframerate(self.sample_rate)
+
+        return wf
+
+    def write_bytes(self, data):
+        self.file.writeframes(data)
+
+
+class raw_writer(product_writer):
+    # Only the packed samples, ready for any tool that reads bytes
+    pass
+
+
+class npy_writer(product_writer):
+    def open(self):
+        f = super().open()
+
+        # Room for the header, written once the length is known
+        f.write(bytes(NPY_HEADER_SIZE))
+
+        return f
+
+    def finish(self):
+        nr_frames = self.nr_bytes // self.dtype.itemsize // self.nchannels
+        shape = (nr_frames,) if self.nchannels == 1 else (nr_frames, self.nchannels)
+
+        header = repr({"descr": self.dtype.str, "fortran_order": False, "shape": shape})
+
+        # Magic, version 1.0, header length, then the header padded with spaces
+        prefix = b"\x93NUMPY\x01\x00" + struct.pack("<H", NPY_HEADER_SIZE - 10)
+        header = header.encode("latin1").ljust(NPY_HEADER_SIZE - len(prefix) - 1) + b"\n"
+
+        self.file.seek(0)
+        self.file.write(prefix + header)
+
+
+class chunked_writer(product_writer):
+    def open(self):
+        # Frames of every block, so that variable-length blocks can be read back
+        self.block_lengths = []
+
+        f = super().open()
+
+        # Room for the header, written once the dtype is known
+        f.write(bytes(CHUNKED_HEADER.size))
+
+        return f
+
+    def write(self, block):
+        super().write(block)
+        self.block_lengths.append(len(block))
+
+    def finish(self):
+        # The index of the blocks goes after the samples
+        self.file.write(np.array(self.block_lengths, dtype="<u8").tobytes())
+        self.file.write(CHUNKED_FOOTER.pack(len(self.block_lengths), self.nr_bytes, CHUNKED_MAGIC))
+
+        self.file.seek(0)
+        self.file.write(CHUNKED_HEADER.pack(CHUNKED_MAGIC, self.dtype.str.encode(),
+                                            self.sample_rate or 0, self.nchannels))
+
+
+def read_raw(file_path, block_size, dtype="<i2", sample_rate=None):
+    # Nothing tells the layout of the samples, they are taken as 16-bit mono
+    dtype = np.dtype(dtype)
+    return mapped_blocks(file_path, dtype, 0, getsize(file_path) // dtype.itemsize,
+                         frame_rate=sample_rate, block_size=block_size)
+
+
+def read_npy(file_path, block_size):
+    with open(file_path, "rb") as f:
+        if np.lib.format.read_magic(f) == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+
+        data_offset = f.tell()
+
+    num_channels = 1 if len(shape) == 1 else shape[1]
+    return mapped_blocks(file_path, dtype, data_offset, shape[0], num_channels,
+                         block_size=block_size)
+
+
+def read_chunked(file_path, block_size):
+    file_size = getsize(file_path)
+
+    with open(file_path, "rb") as f:
+        magic, descr, sample_rate, num_channels = CHUNKED_HEADER.unpack(
+            f.read(CHUNKED_HEADER.size))
+
+        f.seek(file_size - CHUNKED_FOOTER.size)
+        nr_blocks, data_size, footer_magic = CHUNKED_FOOTER.unpack(f.read(CHUNKED_FOOTER.size))
+
+        if magic != CHUNKED_MAGIC or footer_magic != CHUNKED_MAGIC:
+            raise ValueError(f"Not a chunked product: {file_path}")
+
+        f.seek(CHUNKED_HEADER.size + data_size)
+        block_lengths = np.frombuffer(f.read(8 * nr_blocks), dtype="<u8")
+
+    dtype = np.dtype(descr.rstrip(b"\0").decode())
+    num_frames = data_size // dtype.itemsize // num_channels
+
+    blocks = mapped_blocks(file_path, dtype, CHUNKED_HEADER.size, num_frames, num_channels,
+                           sample_rate or None, block_size)
+
+    # The blocks as they were written
+    blocks.block_lengths = block_lengths.astype(np.int64)
+
+    return blocks
+
+
+# Extension, writer and reader of every product format
+PRODUCT_FORMATS = {
+    "wav": (".wav", wav_writer, mapped_wav_blocks),
+    "raw": (".raw", raw_writer, read_raw),
+    "npy": (".npy", npy_writer, read_npy),
+    "chunked": (".chunked", chunked_writer, read_chunked),
+}
+
+DEFAULT_PRODUCT_FORMAT = "wav"
+
+
+def check_product_format(product_format):
+    if product_format not in PRODUCT_FORMATS:
+        raise ValueError(f"Unknown product format: {product_format}")
+
+
+def product_name(name, product_format):
+    # The same name as the input, with the extension of the format
+    return str(Path(name).with_suffix(PRODUCT_FORMATS[product_format][0]))
+
+
+def product_format_of(file_path):
+    suffix = Path(file_path).suffix
+
+    for product_format, (extension, _, _) in PRODUCT_FORMATS.items():
+        if suffix == extension:
+            return product_format
+
+    return None
+
+
+def list_products(directory):
+    # The files of the directory that hold samples, in any format
+    return sorted(
+        file for file in listdir(directory)
+        if product_format_of(file) is not None and isfile(join(directory, file))
+    )
+
+
+def open_writer(file_path, sample_rate, nchannels, sampwidth, buffer_size=DEFAULT_BUFFER_SIZE,
+                nr_buffers=DEFAULT_NR_BUFFERS):
+    _, writer, _ = PRODUCT_FORMATS[product_format_of(file_path)]
+    return writer(file_path, sample_rate, nchannels, sampwidth, buffer_size, nr_buffers)
+
+
+def open_product(file_path, block_size=1024):
+    """
+    Maps the samples of a product of any format, without reading them.
+    """
+    product_format = product_format_of(file_path)
+
+    if product_format is None:
+        raise ValueError(f"Unknown product format: {file_path}")
+
+    _, _, reader = PRODUCT_FORMATS[product_format]
+    return reader(file_path, block_size)
@@ -0,0 +1,107 @@
+import struct
+
+from os import truncate
+from os.path import getsize
+
+# Size of the chunk id and chunk size fields
+CHUNK_HEADER_SIZE = 8
+
+
+class wav_header:
+    def __init__(self, num_channels, sample_width, frame_rate,
+                 data_offset, data_size, data_size_offset, file_size):
+        self.num_channels = num_channels
+        self.sample_width = sample_width
+        self.frame_rate = frame_rate
+
+        # Where the samples start and how many bytes they take
+        self.data_offset = data_offset
+        self.data_size = data_size
+
+        # Where the size of the data chunk is stored, in case it needs patching
+        self.data_size_offset = data_size_offset
+        self.file_size = file_size
+
+    @property
+    def frame_size(self):
+        return self.num_channels * self.sample_width
+
+    @property
+    def num_frames(self):
+        return self.data_size // self.frame_size
+
+    @property
+    def data_is_last(self):
+        # Padding byte included, nothing should follow the samples
+        return self.data_offset + self.data_size + self.data_size % 2 >= self.file_size
+
+
+def read_wav_header(file_path):
+    file_size = getsize(file_path)
+
+    with open(file_path, "rb") as f:
+        # Check the RIFF container
+        riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            raise ValueError(f"Not a WAV file: {file_path}")
+
+        fmt = None
+        offset = 12
+
+        # Walk the chunks until the samples are found
+        while offset + CHUNK_HEADER_SIZE <= file_size:
+            f.seek(offset)
+            chunk_id, chunk_size = struct.unpack("<4sI", f.read(CHUNK_HEADER_SIZE))
+
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", f.read(16))
+
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError(f"Data before format chunk: {file_path}")
+
+                _, num_channels, frame_rate, _, _, bits = fmt
+                data_offset = offset + CHUNK_HEADER_SIZE
+
+                # Streamed files may have a bogus size, trust the file instead
+                data_size = min(chunk_size, file_size - data_offset)
+
+                return wav_header(num_channels, bits // 8, frame_rate,
+                                  data_offset, data_size, offset + 4, file_size)
+
+            # Chunks are aligned to two bytes
+            offset += CHUNK_HEADER_SIZE + chunk_size + chunk_size % 2
+
+    raise ValueError(f"No data chunk: {file_path}")
+
+
+def truncate_wav(file_path, num_frames):
+    """
+    Cuts the samples of a WAV file after num_frames frames, in place, by
+    truncating the file and patching the sizes in its header. Returns False,
+    leaving the file untouched, if other chunks follow the samples.
+    """
+    header = read_wav_header(file_path)
+
+    if not header.data_is_last:
+        return False
+
+    data_size = min(num_frames, header.num_frames) * header.frame_size
+
+    # Chunks are aligned to two bytes, an odd chunk ends with a padding byte
+    file_size = header.data_offset + data_size + data_size % 2
+    truncate(file_path, file_size)
+
+    with open(file_path, "r+b") as f:
+        if data_size % 2:
+            f.seek(file_size - 1)
+            f.write(b"\0")
+
+        # Size of the RIFF container, without its own id and size fields
+        f.seek(4)
+        f.write(struct.pack("<I", file_size - CHUNK_HEADER_SIZE))
+
+        f.seek(header.data_size_offset)
+        f.write(struct.pack("<I", data_size))
+
+    return True
@@ -0,0 +1,73 @@
+import threading
+
+import numpy as np
+
+
+class ring_buffer:
+    """
+    Fixed-size buffer of samples between a producer and a consumer thread.
+    When the consumer falls behind, the oldest samples are overwritten.
+    """
+    def __init__(self, capacity, dtype=np.int16):
+        self.data = np.empty(capacity, dtype=dtype)
+        self.capacity = capacity
+
+        # Position of the oldest sample and number of samples held
+        self.start = 0
+        self.size = 0
+
+        # Samples overwritten before they were read
+        self.nr_dropped = 0
+
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def write(self, samples):
+        with self.condition:
+            # Only the newest samples fit
+            if len(samples) > self.capacity:
+                self.nr_dropped += len(samples) - self.capacity
+                samples = samples[-self.capacity:]
+
+            # Make room by forgetting the oldest samples
+            overflow = self.size + len(samples) - self.capacity
+            if overflow > 0:
+                self.start = (self.start + overflow) % self.capacity
+                self.size -= overflow
+                self.nr_dropped += overflow
+
+            # Copy, wrapping around the end of the buffer
+            end = (self.start + self.size) % self.capacity
+            first = min(len(samples), self.capacity - end)
+            self.data[end:end + first] = samples[:first]
+            self.data[:len(samples) - first] = samples[first:]
+            self.size += len(samples)
+
+            self.condition.notify_all()
+
+    def read(self, n, timeout=None):
+        """
+        Waits for n samples and returns them. Returns fewer samples if the
+        buffer is closed or the timeout expires first.
+        """
+        # The buffer would never hold that many samples
+        if n > self.capacity:
+            raise ValueError(f"Cannot read {n} samples from a ring of {self.capacity}")
+
+        with self.condition:
+            self.condition.wait_for(lambda: self.size >= n or self.closed, timeout)
+
+            n = min(n, self.size)
+            indices = (self.start + np.arange(n)) % self.capacity
+            samples = self.data[indices]
+
+            self.start = (self.start + n) % self.capacity
+            self.size -= n
+
+            return samples
+
+    def close(self):
+        # No more samples will come
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
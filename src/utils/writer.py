@@ -0,0 +1,133 @@
+import threading
+import time
+
+from queue import Queue
+
+# Buffers filled by the producer while the others are written
+DEFAULT_NR_BUFFERS = 2
+
+
+class buffered_writer:
+    """
+    Copies the data into preallocated buffers, and writes the full ones from a
+    background thread, so that producing the next data does not wait for the
+    disk. The producer only waits, or stalls, when all buffers are full.
+    """
+    def __init__(self, write, buffer_size, nr_buffers=DEFAULT_NR_BUFFERS):
+        self.write_func = write
+
+        # Free buffers, and full ones waiting to be written with their length
+        self.free = Queue()
+        for _ in range(nr_buffers):
+            self.free.put(bytearray(buffer_size))
+        self.full = Queue()
+
+        # Buffer being filled
+        self.current = None
+        self.length = 0
+
+        self.error = None
+
+        # Where the time goes
+        self.nr_bytes = 0
+        self.nr_buffers = 0
+        self.nr_stalls = 0
+        self.stall_seconds = 0
+        self.write_seconds = 0
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.full.get()
+
+            # The producer is done
+            if item is None:
+                break
+
+            buffer, length = item
+
+            # Keep cycling the buffers, so that the producer never waits forever
+            if self.error is None:
+                start = time.perf_counter()
+
+                try:
+                    self.write_func(memoryview(buffer)[:length])
+                except Exception as e:
+                    self.error = e
+
+                self.write_seconds += time.perf_counter() - start
+
+            self.free.put(buffer)
+
+    def write(self, data):
+        # Fail early, the data would be lost anyway
+        if self.error is not None:
+            raise self.error
+
+        data = memoryview(data).cast("B")
+        self.nr_bytes += len(data)
+
+        while len(data) > 0:
+            if self.current is None:
+                self.next_buffer()
+
+            # Fill the current buffer as much as possible
+            n = min(len(data), len(self.current) - self.length)
+            self.current[self.length:self.length + n] = data[:n]
+            self.length += n
+            data = data[n:]
+
+            if self.length == len(self.current):
+                self.submit()
+
+    def next_buffer(self):
+        # All the buffers are waiting for the disk
+        if self.free.empty():
+            self.nr_stalls += 1
+
+        start = time.perf_counter()
+        self.current = self.free.get()
+        self.stall_seconds += time.perf_counter() - start
+
+    def submit(self):
+        self.full.put((self.current, self.length))
+        self.nr_buffers += 1
+
+        self.current = None
+        self.length = 0
+
+    def close(self):
+        if self.thread is None:
+            return
+
+        # Write what is left
+        if self.length > 0:
+            self.submit()
+
+        self.full.put(None)
+        self.thread.join()
+        self.thread = None
+
+        if self.error is not None:
+            raise self.error
+
+    def stats(self):
+        return {
+            "bytes": self.nr_bytes,
+            "buffers": self.nr_buffers,
+            "write_seconds": self.write_seconds,
+            "stalls": self.nr_stalls,
+            "stall_seconds": self.stall_seconds,
+        }
+
+
+def merge_stats(write_stats, name, stats):
+    # Add up the writes of all the files of a product directory
+    if write_stats is None:
+        return
+
+    total = write_stats.setdefault(name, dict.fromkeys(stats, 0))
+    for key, value in stats.items():
+        total[key] += value
@@ -0,0 +1,50 @@
+#!/bin/bash
+
+# The runs counted by the FIPS 140-2 tests, against a bit by bit count
+# that reads every byte from its least significant bit, like rngtest
+PYTHONPATH=src python3 - <<'EOF'
+import numpy as np
+
+from randomness.fips import BLOCK_BYTES, LONG_RUN, count_runs
+
+
+def reference_runs(block):
+    counts = np.zeros((2, 6), dtype=np.int64)
+    long_runs = 0
+
+    bits = [(byte >> i) & 1 for byte in block.tolist() for i in range(8)]
+    length = 0
+
+    for i, bit in enumerate(bits):
+        length += 1
+
+        # The run ends at a change or at the end of the block
+        if i + 1 == len(bits) or bits[i + 1] != bit:
+            counts[bit, min(length, 6) - 1] += 1
+            long_runs += length >= LONG_RUN
+            length = 0
+
+    return counts, long_runs
+
+
+rng = np.random.default_rng(0)
+blocks = [
+    rng.integers(0, 256, BLOCK_BYTES, dtype=np.uint8),
+    # Ones and zeros alternate across the byte boundaries only when read LSB first
+    np.tile(np.array([0x0F, 0xF0], dtype=np.uint8), BLOCK_BYTES // 2),
+    np.tile(np.array([0x01, 0x80], dtype=np.uint8), BLOCK_BYTES // 2),
+    # Long runs of zeros
+    np.where(rng.random(BLOCK_BYTES) < 0.9, 0, rng.integers(0, 256, BLOCK_BYTES)).astype(np.uint8),
+]
+
+counts, long_runs = count_runs(np.stack(blocks))
+
+for i, block in enumerate(blocks):
+    expected_counts, expected_long_runs = reference_runs(block)
+
+    if not np.array_equal(counts[i], expected_counts) or long_runs[i] != expected_long_runs:
+        raise SystemExit(f"Block {i}: runs {counts[i].tolist()}, long runs {long_runs[i]}, "
+                         + f"expected {expected_counts.tolist()}, {expected_long_runs}")
+
+print("FIPS 140-2 runs match the bit by bit count.")
+EOF
@@ -0,0 +1,19 @@
+#!/bin/bash
+
+# Use the fake radios from tests/fake instead of real ones
+export PATH="$(dirname "$(realpath "$0")")/fake:$PATH"
+
+# Four frequencies on two dongles take two durations
+time python3 src/main.py                                       \
+    --source 'fm(freqs=["80M", "160M", "230M", "440M"], devices=[0, 1])' \
+    --acquire                                                  \
+    --duration 5                                               \
+    --name test_fm_devices
+
+# Every dongle fails once per frequency, and the second one never works,
+# the first one has to restart and record everything
+FAKE_RTL_FM_FLAKY="$(mktemp -d)" FAKE_RTL_FM_BROKEN=1 python3 src/main.py \
+    --source 'fm(freqs=["80M", "160M"], devices=[0, 1], restarts=1)' \
+    --acquire                                                  \
+    --duration 2                                               \
+    --name test_fm_devices_flaky
@@ -0,0 +1,25 @@
+#!/bin/bash
+
+# Use the fake radio from tests/fake instead of a real one
+export PATH="$(dirname "$(realpath "$0")")/fake:$PATH"
+
+python3 src/main.py                                            \
+    --source 'fm(freqs=["100M"])'                              \
+    --stream                                                   \
+    --persist_stream                                           \
+    --duration 5                                               \
+    --block_size 4096                                          \
+    --operations "[health_test, uniformize_signal, von_neumann]" \
+    --evaluate_only_last_operation                             \
+    --name test_fm_stream                                      \
+    --tests "[ent, rngtest]"
+
+# The radio gets stuck after 2 seconds, the health test has to stop the stream
+FAKE_RTL_FM_STUCK=2 python3 src/main.py                        \
+    --source 'fm(freqs=["100M"])'                              \
+    --stream                                                   \
+    --duration 0                                               \
+    --block_size 4096                                          \
+    --operations '[health_test(action="raise"), von_neumann]'  \
+    --evaluate_only_last_operation                             \
+    --name test_fm_stream_stuck
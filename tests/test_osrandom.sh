@@ -5,3 +5,11 @@ python3 src/main.py
     --acquire                                                                                   \
     --plots "[distribution, spectrum, spectrogram, magnitude_distribution, phase_distribution]" \
     --tests "[ent, rngtest]"
+
+# An hour long baseline, from the non-blocking pool
+python3 src/main.py                                                                             \
+    --source 'osrandom(chunk_size=65536, urandom=True)'                                         \
+    --acquire                                                                                   \
+    --duration 3600                                                                             \
+    --name test_osrandom_long                                                                   \
+    --tests "[ent]"
@@ -0,0 +1,14 @@
+#!/bin/bash
+
+# The same chain, with the products stored in every format
+for format in wav raw npy chunked; do
+    python3 src/main.py                                                 \
+        --source osrandom                                               \
+        --acquire                                                       \
+        --operations "[uniformize_signal, von_neumann]"                 \
+        --evaluate_only_last_operation                                  \
+        --name "test_product_formats_$format"                           \
+        --block_size 4096                                               \
+        --product_format "$format"                                      \
+        --tests "[ent, rngtest]"
+done
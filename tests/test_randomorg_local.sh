@@ -0,0 +1,35 @@
+#!/bin/bash
+
+# Serve random.org from tests/fake instead of using the real one
+FAKE="$(dirname "$(realpath "$0")")/fake"
+PORT=8765
+URLS="url=\"http://127.0.0.1:$PORT/integers/\", quota_url=\"http://127.0.0.1:$PORT/quota/\""
+
+# The first requests find the service busy, and have to wait as told
+FAKE_RANDOMORG_BUSY=3 "$FAKE/randomorg_server" $PORT &
+SERVER=$!
+sleep 1
+
+python3 src/main.py                                            \
+    --source "randomorg($URLS, concurrency=4)"                 \
+    --acquire                                                  \
+    --duration 5                                               \
+    --name test_randomorg_local                                \
+    --tests "[ent]"
+
+kill $SERVER
+wait $SERVER
+
+# The quota is only enough for a second of samples, at 32 kHz
+FAKE_RANDOMORG_QUOTA=$((16 * 32000)) "$FAKE/randomorg_server" $PORT &
+SERVER=$!
+sleep 1
+
+python3 src/main.py                                            \
+    --source "randomorg($URLS)"                                \
+    --acquire                                                  \
+    --duration 5                                               \
+    --name test_randomorg_local_quota
+
+kill $SERVER
+wait $SERVER
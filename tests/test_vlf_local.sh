@@ -0,0 +1,34 @@
+#!/bin/bash
+
+# Stream a local file instead of abelian.org, ffmpeg is still needed
+FAKE="$(dirname "$(realpath "$0")")/fake"
+PORT=8766
+URL="url=\"http://127.0.0.1:$PORT/vlf\""
+
+# Any recording will do as the stream
+python3 src/main.py --source osrandom --acquire --duration 10
+
+# Every connection is dropped after 3 seconds, the hosts have to reconnect
+FAKE_VLF_DROP=3 "$FAKE/vlf_server" $PORT audio/osrandom/sources/osrandom.wav &
+SERVER=$!
+sleep 1
+
+python3 src/main.py                                            \
+    --source "vlf(hosts=[\"1\", \"2\"], $URL)"                 \
+    --acquire                                                  \
+    --duration 8                                               \
+    --name test_vlf_local                                      \
+    --tests "[ent]"
+
+# Process the live data as it comes
+python3 src/main.py                                            \
+    --source "vlf(hosts=[\"1\"], $URL)"                        \
+    --stream                                                   \
+    --duration 8                                               \
+    --block_size 4096                                          \
+    --operations "[health_test, uniformize_signal, von_neumann]" \
+    --evaluate_only_last_operation                             \
+    --name test_vlf_local_stream
+
+kill $SERVER
+wait $SERVER